@@ -1,15 +1,229 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.responses import HTMLResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import psycopg2
-import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+from typing import List, Literal
+import asyncio
+import base64
+import json
+import orjson
+import os
 import time
 import re
 
+from cache import ResultCache
+from db import DatabasePool, PoolTimeoutError
+from facets import FILTER_SQL, NO_FILTERS, facet_params, facets_sql, filter_params, has_filters, shape_facets, with_filters
+from fusion import reciprocal_rank_fusion
+from ingredients import normalize_ingredient, split_components
+from memory_backend import MemoryBackend
+from metrics import registry, stage, start_timer
+from prefix_index import PrefixIndex
+from singleflight import SingleFlight, SingleFlightTimeout
+from slow_queries import SlowQueryLog
+from suggest import Suggester
+
 load_dotenv()
 
-app = FastAPI(title="Medicine Search API", version="1.0.0")
+# "postgres", or "memory" to answer /search/* from an index built in process memory (memory_backend.py)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "postgres")
+db_pool = MemoryBackend.from_env() if SEARCH_BACKEND == "memory" else DatabasePool.from_env()
+
+# Optional in-memory autocomplete index, answers /search/prefix without a database round trip
+PREFIX_INDEX_ENABLED = os.getenv("PREFIX_INDEX_ENABLED", "0") == "1" and SEARCH_BACKEND == "postgres"
+prefix_index = PrefixIndex(max_bytes=int(os.getenv("PREFIX_INDEX_MAX_MB", "512")) * 2**20)
+
+# Search result cache, invalidated whenever import_data.py bumps data_version
+result_cache = ResultCache.from_env()
+DATA_VERSION_POLL_SECONDS = float(os.getenv("DATA_VERSION_POLL_SECONDS", "5"))
+
+# Typeahead candidate sets, reused while a query keeps extending the same prefix
+suggester = Suggester.from_env()
+
+# Concurrent identical searches share one database execution
+single_flight = SingleFlight.from_env()
+
+# Send per-stage timings to clients in a Server-Timing header
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Searches slower than SLOW_QUERY_MS are logged, a sample re-run under EXPLAIN ANALYZE
+slow_query_log = SlowQueryLog.from_env()
+if SEARCH_BACKEND == "postgres":
+    slow_query_log.connection_factory = db_pool.connection
+
+# Page size bounds for every /search endpoint
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+# Minimum pg_trgm word similarity for a fuzzy match (overridable per request)
+FUZZY_THRESHOLD = float(os.getenv("FUZZY_SIMILARITY_THRESHOLD", "0.4"))
+
+# Unified /search: per-strategy time budgets and reciprocal-rank fusion weights
+SEARCH_BUDGETS = {
+    "prefix": float(os.getenv("SEARCH_PREFIX_BUDGET_MS", "50")) / 1000,
+    "fulltext": float(os.getenv("SEARCH_FULLTEXT_BUDGET_MS", "150")) / 1000,
+    "fuzzy": float(os.getenv("SEARCH_FUZZY_BUDGET_MS", "150")) / 1000,
+}
+FUSION_WEIGHTS = {"prefix": 1.0, "fulltext": 1.0, "fuzzy": 0.8}
+
+# POST /search/batch: size cap, items answered per set-based query, and windows in flight per batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50000"))
+BATCH_WINDOW = int(os.getenv("BATCH_WINDOW", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# Hot searches each worker replays at startup; /readyz reports 503 until they have run
+WARMUP_QUERIES = os.getenv("WARMUP_QUERIES", "benchmark_queries.json")
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "30"))
+warmup_state = {"ready": False, "queries": 0, "failed": 0, "seconds": None}
+
+# /readyz gives up on the pool checkout plus SELECT 1 after READY_TIMEOUT seconds
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT_SECONDS", "2"))
+
+# Row count, index sizes and data version reported by /stats, refreshed in the background
+CATALOG_STATS_SECONDS = float(os.getenv("CATALOG_STATS_SECONDS", "60"))
+catalog_stats = {}
+
+@asynccontextmanager
+async def lifespan(app):
+    db_pool.open()
+    try:
+        result_cache.set_data_version(await db_pool.run(_read_data_version))
+    except Exception as e:
+        print(f"Could not read data version: {e}")
+    if PREFIX_INDEX_ENABLED:
+        await refresh_prefix_index()
+    poller = asyncio.create_task(poll_data_version())
+    catalog_poller = asyncio.create_task(poll_catalog_stats())
+    warmer = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        warmer.cancel()
+        catalog_poller.cancel()
+        poller.cancel()
+        slow_query_log.close()
+        db_pool.close()
+
+DATA_VERSION_SQL = "SELECT version FROM data_version"
+
+def _read_data_version(cursor):
+    cursor.execute(DATA_VERSION_SQL)
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+async def poll_data_version():
+    """Drop cached results and rebuild in-memory indexes when the medicines table is reloaded"""
+    while True:
+        await asyncio.sleep(DATA_VERSION_POLL_SECONDS)
+        try:
+            version = await db_pool.run(_read_data_version)
+        except Exception as e:
+            print(f"Data version check failed: {e}")
+            continue
+        if result_cache.set_data_version(version):
+            print(f"Data version changed to {version}, search cache invalidated")
+            suggester.clear()
+            await refresh_catalog_stats()
+            if PREFIX_INDEX_ENABLED:
+                await refresh_prefix_index()
+
+async def refresh_catalog_stats():
+    try:
+        catalog_stats.update(await db_pool.run(_catalog_stats))
+    except Exception as e:
+        print(f"Catalog stats refresh failed: {e}")
+
+async def poll_catalog_stats():
+    while True:
+        await refresh_catalog_stats()
+        await asyncio.sleep(CATALOG_STATS_SECONDS)
+
+def load_warmup_queries():
+    """(type, query) pairs from a benchmark_queries.json-style file, none if it doesn't exist"""
+    if not WARMUP_QUERIES or not os.path.exists(WARMUP_QUERIES):
+        return []
+    with open(WARMUP_QUERIES, "r") as f:
+        queries = json.load(f).get("queries", {})
+    return [(spec["type"], spec["query"]) for spec in queries.values()]
+
+async def warm_up():
+    """Run the hot searches through the normal handlers so this worker's result cache, connections
+    and the database's buffer cache are warm before /readyz reports ready"""
+    start = time.perf_counter()
+    handlers = {
+        "prefix": lambda q: search_prefix(q, DEFAULT_LIMIT, None, dict(NO_FILTERS), False),
+        "substring": lambda q: search_substring(q, DEFAULT_LIMIT, None, dict(NO_FILTERS), False),
+        "fulltext": lambda q: search_fulltext(q, DEFAULT_LIMIT, None, dict(NO_FILTERS), False),
+        "fuzzy": lambda q: search_fuzzy(q, None, DEFAULT_LIMIT, None, dict(NO_FILTERS), False),
+    }
+
+    async def replay(queries):
+        for search_type, q in queries:
+            try:
+                await handlers[search_type](q)
+                warmup_state["queries"] += 1
+            except (KeyError, HTTPException) as e:
+                print(f"Warmup search {search_type} {q!r} failed: {getattr(e, 'detail', e)}")
+                warmup_state["failed"] += 1
+
+    try:
+        await asyncio.wait_for(replay(load_warmup_queries()), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Warmup stopped after {WARMUP_TIMEOUT}s")
+    except Exception as e:
+        print(f"Warmup failed: {e}")
+    warmup_state["seconds"] = round(time.perf_counter() - start, 3)
+    warmup_state["ready"] = True
+    print(f"Worker {os.getpid()} ready: {warmup_state['queries']} warmup searches in {warmup_state['seconds']}s")
+
+async def cached_search(search_type, q, compute, **params):
+    """Return cached results for this search, or compute and store them.
+
+    On a miss, identical searches already in flight are joined rather than run again.
+    """
+    key = result_cache.key(search_type, q, **params)
+    results = result_cache.get(key)
+    if results is None:
+        async def compute_and_store():
+            value = await compute()
+            result_cache.set(key, value)
+            return value
+        results = await single_flight.do(key, compute_and_store)
+    return results
+
+def _facets_query(cursor, match, params, setup=None):
+    return shape_facets(fetch_rows(cursor, facets_sql(match), facet_params(params), setup))
+
+async def search_facets(search_type, q, match, params, setup=None):
+    """Facet counts for a search's full match set, cached like results so popular and empty queries skip the aggregate"""
+    key_params = {name: value for name, value in params.items() if name.startswith("f_") or name == "threshold"}
+    return await cached_search(
+        "facets:" + search_type, q, lambda: db_pool.run(_facets_query, match, params, setup), **key_params
+    )
+
+async def gather_facets(search, facets):
+    """Await a search and, when requested, its facet counts alongside it"""
+    if facets is None:
+        return await search, None
+    return await asyncio.gather(search, facets)
+
+async def refresh_prefix_index():
+    try:
+        count = await db_pool.run(prefix_index.load_from_cursor)
+        print(f"Prefix index built: {count} names, {prefix_index.memory['total_mb']} MB "
+              f"in {prefix_index.build_seconds:.2f}s")
+    except Exception as e:
+        # Prefix search falls back to the database while the index is unavailable
+        print(f"Prefix index build failed: {e}")
+
+app = FastAPI(
+    title="Medicine Search API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,14 +233,111 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME", "medicine_search"),
-        user=os.getenv("DB_USER", "postgres"),
-        password=os.getenv("DB_PASSWORD", "password"),
-        host=os.getenv("DB_HOST", "localhost"),
-        port=os.getenv("DB_PORT", "5433")
-    )
+@app.exception_handler(PoolTimeoutError)
+@app.exception_handler(SingleFlightTimeout)
+async def unavailable_handler(request, exc):
+    """No database connection (or shared execution) in time: the client may retry"""
+    return ORJSONResponse({"detail": str(exc)}, status_code=503)
+
+@app.exception_handler(NotImplementedError)
+async def not_implemented_handler(request, exc):
+    """A query the configured search backend can't run (see MemoryCursor)"""
+    return ORJSONResponse({"detail": str(exc)}, status_code=501)
+
+@app.exception_handler(Exception)
+async def failed_handler(request, exc):
+    return ORJSONResponse({"detail": f"Search failed: {str(exc)}"}, status_code=500)
+
+def escape_like(value):
+    """Escape LIKE/ILIKE metacharacters so user input only ever matches literally"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def prefix_bounds(q):
+    """Half-open range [low, high) covering every lower-cased name that starts with q"""
+    low = q.lower()
+    head = low
+    while head:
+        last = ord(head[-1])
+        if last < 0x10FFFF:
+            nxt = last + 1
+            if 0xD800 <= nxt <= 0xDFFF:  # Surrogates can't be encoded, jump past them
+                nxt = 0xE000
+            return low, head[:-1] + chr(nxt)
+        head = head[:-1]
+    return low, low + chr(0x10FFFF)
+
+def encode_cursor(search_type, key):
+    """Opaque pagination cursor holding the sort key of the last row on a page"""
+    raw = json.dumps([search_type, *key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+# Types of the sort key a cursor carries for each search type, as built by its *_key() function
+CURSOR_KEYS = {
+    "prefix": (str, int),
+    "substring": (str, int),
+    "fulltext": (float, str, int),
+    "fuzzy": (float, str, int),
+    "ingredient": (str, int),
+    "substitutes": (float, str, int),
+}
+
+def decode_cursor(search_type, cursor):
+    types = CURSOR_KEYS[search_type]
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(data, list) or len(data) != len(types) + 1 or data[0] != search_type:
+            raise ValueError(cursor)
+        key = []
+        for value, kind in zip(data[1:], types):
+            # bool is an int subclass; a float sort key may come back as a JSON integer
+            if isinstance(value, bool) or not isinstance(value, (int, float) if kind is float else kind):
+                raise ValueError(cursor)
+            key.append(kind(value))
+        return tuple(key)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate(rows, limit, search_type, sort_key):
+    """Trim a limit + 1 fetch to one page and build the cursor for the next one"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(search_type, sort_key(rows[-1]))
+
+# Leading columns of every search query, in SELECT order
+MEDICINE_FIELDS = ("name", "manufacturer_name", "type", "price", "pack_size_label", "short_composition")
+
+def row_to_medicine(row):
+    # zip stops at the six medicine columns and ignores trailing score/sort-key columns
+    return dict(zip(MEDICINE_FIELDS, row))
+
+def fetch_rows(cursor, sql, params, setup=None):
+    """Execute and fetch a search query; `setup` (e.g. a SET) is sent in the same round trip"""
+    start = time.perf_counter()
+    with stage("execute"):
+        cursor.execute(setup + sql if setup else sql, params)
+    with stage("fetch"):
+        rows = cursor.fetchall()
+    slow_query_log.observe(sql, params, (time.perf_counter() - start) * 1000, setup)
+    return rows
+
+def search_response(q, search_type, results, next_cursor, timer, **extra):
+    """Serialize a search result page with orjson, bypassing FastAPI's jsonable_encoder"""
+    execution_time = time.perf_counter() - timer.started
+    with stage("serialize"):
+        response = ORJSONResponse({
+            "query": q,
+            "type": search_type,
+            "results": results,
+            "count": len(results),
+            "next_cursor": next_cursor,
+            "execution_time_ms": round(execution_time * 1000, 2),
+            **{name: value for name, value in extra.items() if value is not None}
+        })
+    timer.finish()
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timer.server_timing()
+    return response
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -74,11 +385,13 @@ async def root():
         <h1>🏥 Medicine Search Portal</h1>
         <div class="search-section">
             <div class="search-box">
-                <input type="text" id="searchInput" placeholder="Search medicines (e.g., aspirin, paracetamol, ibuprofen)..." autocomplete="off">
+                <input type="text" id="searchInput" list="suggestions" placeholder="Search medicines (e.g., aspirin, paracetamol, ibuprofen)..." autocomplete="off">
+                <datalist id="suggestions"></datalist>
                 <button class="search-btn-main" onclick="searchMedicines()">🔍 Search</button>
             </div>
             <div class="search-types">
-                <button class="search-btn active" id="prefix-btn" onclick="setSearchType('prefix')">🎯 Prefix</button>
+                <button class="search-btn active" id="all-btn" onclick="setSearchType('all')">✨ All</button>
+                <button class="search-btn" id="prefix-btn" onclick="setSearchType('prefix')">🎯 Prefix</button>
                 <button class="search-btn" id="substring-btn" onclick="setSearchType('substring')">📝 Contains</button>
                 <button class="search-btn" id="fulltext-btn" onclick="setSearchType('fulltext')">📚 Smart</button>
                 <button class="search-btn" id="fuzzy-btn" onclick="setSearchType('fuzzy')">🔄 Fuzzy</button>
@@ -87,7 +400,39 @@ async def root():
         <div id="results" class="results"></div>
     </div>
     <script>
-        let currentSearchType = 'prefix';
+        let currentSearchType = 'all';
+        let searchController = null;
+        let suggestController = null;
+        let suggestTimer = null;
+        
+        function escapeHtml(text) {
+            return text.replace(/&/g, '&amp;').replace(/"/g, '&quot;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+        }
+        
+        // Typeahead: wait for a pause in typing, and drop the previous keystroke's request if it is still running
+        function scheduleSuggestions() {
+            clearTimeout(suggestTimer);
+            suggestTimer = setTimeout(fetchSuggestions, 150);
+        }
+        
+        async function fetchSuggestions() {
+            const query = document.getElementById('searchInput').value.trim();
+            const list = document.getElementById('suggestions');
+            if (suggestController) suggestController.abort();
+            if (!query) {
+                list.innerHTML = '';
+                return;
+            }
+            suggestController = new AbortController();
+            try {
+                const response = await fetch(`/suggest?q=${encodeURIComponent(query)}`, { signal: suggestController.signal });
+                if (!response.ok) return;
+                const data = await response.json();
+                list.innerHTML = data.suggestions.map(name => `<option value="${escapeHtml(name)}"></option>`).join('');
+            } catch (error) {
+                if (error.name !== 'AbortError') console.error('Suggest error:', error);
+            }
+        }
         
         function setSearchType(type) {
             currentSearchType = type;
@@ -104,8 +449,14 @@ async def root():
             
             document.getElementById('results').innerHTML = '<div class="loading">🔍 Searching medicines database...</div>';
             
+            // A new search supersedes pending suggestions and any search still in flight
+            clearTimeout(suggestTimer);
+            if (suggestController) suggestController.abort();
+            if (searchController) searchController.abort();
+            searchController = new AbortController();
+            
             try {
-                const response = await fetch(`/search/${currentSearchType}?q=${encodeURIComponent(query)}`);
+                const response = await fetch(`${currentSearchType === 'all' ? '/search' : '/search/' + currentSearchType}?q=${encodeURIComponent(query)}`, { signal: searchController.signal });
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
                 }
@@ -114,6 +465,7 @@ async def root():
                 const resultsDiv = document.getElementById('results');
                 if (data.results && data.results.length > 0) {
                     const searchTypeNames = {
+                        'all': 'All Strategies',
                         'prefix': 'Prefix Search',
                         'substring': 'Contains Search', 
                         'fulltext': 'Smart Search',
@@ -148,6 +500,7 @@ async def root():
                     `;
                 }
             } catch (error) {
+                if (error.name === 'AbortError') return;
                 document.getElementById('results').innerHTML = `
                     <div class="no-results">
                         ⚠️ Search error occurred<br>
@@ -158,6 +511,8 @@ async def root():
             }
         }
         
+        document.getElementById('searchInput').addEventListener('input', scheduleSuggestions);
+        
         document.getElementById('searchInput').addEventListener('keypress', function(e) {
             if (e.key === 'Enter') {
                 searchMedicines();
@@ -170,213 +525,750 @@ async def root():
 </body>
 </html>"""
 
-@app.get("/health")
-async def health_check():
+PING_SQL = "SELECT 1"
+COUNT_SQL = "SELECT COUNT(*) FROM medicines"
+
+# Planner's row estimate, kept current by autovacuum and import_data.py's ANALYZE (-1 until the first one)
+CATALOG_SQL = """
+    SELECT c.reltuples::bigint, pg_table_size(c.oid), (SELECT version FROM data_version)
+    FROM pg_class c
+    WHERE c.oid = 'medicines'::regclass
+"""
+INDEX_SIZES_SQL = """
+    SELECT t.relname, i.relname, pg_relation_size(i.oid)
+    FROM pg_index x
+    JOIN pg_class t ON t.oid = x.indrelid
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace
+    WHERE t.relname IN ('medicines', 'ingredients', 'medicine_ingredients', 'name_suggestions')
+      AND n.nspname = current_schema()
+    ORDER BY t.relname, i.relname
+"""
+
+def _ping(cursor):
+    cursor.execute(PING_SQL)
+    return cursor.fetchone()[0]
+
+def _catalog_stats(cursor):
+    cursor.execute(CATALOG_SQL)
+    rows, table_bytes, version = cursor.fetchone()
+    estimated = rows >= 0
+    if not estimated:
+        # Never analyzed: count once, the result is cached until the next refresh
+        cursor.execute(COUNT_SQL)
+        rows = cursor.fetchone()[0]
+    cursor.execute(INDEX_SIZES_SQL)
+    indexes = [{"table": table, "index": index, "bytes": size} for table, index, size in cursor.fetchall()]
+    return {
+        "rows": rows,
+        "rows_estimated": estimated,
+        "table_bytes": table_bytes,
+        "index_bytes": sum(index["bytes"] for index in indexes),
+        "indexes": indexes,
+        "data_version": version,
+        "refreshed_at": time.time(),
+    }
+
+async def check_ready():
+    """Raise 503 unless warmup is done and a pooled connection answers SELECT 1 within READY_TIMEOUT"""
+    if not warmup_state["ready"]:
+        raise HTTPException(status_code=503, detail="Warming up")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM medicines")
-        count = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
-        return {"status": "healthy", "medicines_count": count}
+        await db_pool.run_with_deadline(READY_TIMEOUT, _ping)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail=f"Database did not answer within {READY_TIMEOUT}s")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
+@app.get("/livez")
+async def liveness():
+    """The process is up and its event loop responsive; never touches the database"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    await check_ready()
+    return {"status": "ready"}
+
+@app.get("/health")
+async def health_check():
+    """Readiness plus the cached row count, for existing clients; probes should use /livez and /readyz"""
+    await check_ready()
+    return {"status": "healthy", "medicines_count": catalog_stats.get("rows")}
+
+@app.get("/stats")
+async def stats():
+    return {"catalog": catalog_stats, "pool": db_pool.stats(), "cache": result_cache.stats(), "prefix_index": prefix_index.stats(),
+            "slow_queries": slow_query_log.stats(), "single_flight": single_flight.stats(),
+            "suggest": suggester.stats(), "worker": {"pid": os.getpid(), "warmup": warmup_state}}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of stage histograms plus pool and cache gauges"""
+    pool = db_pool.stats()
+    cache = result_cache.stats()
+    samples = [
+        ("db_pool_connections_in_use", "gauge", "Pooled connections checked out", {}, pool["in_use"]),
+        ("db_pool_waiting", "gauge", "Callers waiting for a pooled connection", {}, pool["waiting"]),
+        ("db_pool_max_size", "gauge", "Maximum pooled connections", {}, pool["max_size"]),
+        ("db_pool_acquired_total", "counter", "Connections handed out", {}, pool["acquired_total"]),
+        ("db_pool_timeouts_total", "counter", "Acquire attempts that timed out", {}, pool["timeouts_total"]),
+        ("search_cache_hits_total", "counter", "Result cache hits", {}, cache["hits"]),
+        ("search_cache_misses_total", "counter", "Result cache misses", {}, cache["misses"]),
+        ("search_cache_evictions_total", "counter", "Result cache evictions", {}, cache.get("evictions", 0)),
+        ("search_single_flight_executions_total", "counter", "Searches executed by a single-flight leader", {},
+         single_flight.executions),
+        ("search_single_flight_coalesced_total", "counter", "Searches that joined an in-flight execution "
+         "(database calls saved)", {}, single_flight.coalesced),
+        ("search_single_flight_timeouts_total", "counter", "Waits on a shared execution that timed out", {},
+         single_flight.timeouts),
+        ("search_slow_queries_total", "counter", "Searches over the slow query threshold", {},
+         slow_query_log.slow_total),
+        ("search_data_version", "gauge", "medicines data version currently served", {}, cache["data_version"]),
+        ("search_catalog_rows", "gauge", "medicines rows (planner estimate, refreshed every CATALOG_STATS_SECONDS)",
+         {}, catalog_stats.get("rows", 0)),
+    ]
+    return PlainTextResponse(registry.render(samples), media_type="text/plain; version=0.0.4")
+
+@app.get("/facets")
+async def catalog_facets(filters: dict = Depends(filter_params)):
+    """Facet counts over the whole catalog (the empty query), cached until the data version changes"""
+    timer = start_timer("facets")
+    facet_counts = await search_facets("catalog", "", "TRUE", with_filters({}, filters))
+    timer.finish()
+    return {"facets": facet_counts, "filters": {name[2:]: value for name, value in filters.items()}}
+
+@app.get("/admin/slow-queries")
+async def slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """Most recent slow searches, newest first, with EXPLAIN (ANALYZE, BUFFERS) plans where sampled"""
+    return {"stats": slow_query_log.stats(), "queries": slow_query_log.entries(limit)}
+
+@app.post("/admin/prefix-index/refresh")
+async def refresh_prefix_index_endpoint():
+    """Rebuild the in-memory prefix index after the medicines table changes"""
+    if not PREFIX_INDEX_ENABLED:
+        raise HTTPException(status_code=404, detail="Prefix index is disabled")
+    await refresh_prefix_index()
+    if not prefix_index.ready:
+        raise HTTPException(status_code=500, detail="Prefix index build failed")
+    return prefix_index.stats()
+
+# Range scan on name_lower (COLLATE "C"), served in order by idx_name_prefix
+PREFIX_MATCH = "name_lower >= %(low)s AND name_lower < %(high)s"
+PREFIX_SQL = f"""
+    SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition, name_lower, id
+    FROM medicines
+    WHERE {PREFIX_MATCH}{FILTER_SQL}
+      AND (name_lower, id) > (%(after_name)s, %(after_id)s)
+    ORDER BY name_lower, id
+    LIMIT %(limit)s
+"""
+
+def prefix_params(q, limit=DEFAULT_LIMIT, after=None, filters=None):
+    low, high = prefix_bounds(q)
+    after_name, after_id = after or ("", 0)
+    return with_filters({"low": low, "high": high, "after_name": after_name, "after_id": after_id,
+                         "limit": limit + 1}, filters)
+
+def prefix_key(row):
+    return row[6], row[7]
+
+def _prefix_query(cursor, q, limit, after, filters=None):
+    rows = fetch_rows(cursor, PREFIX_SQL, prefix_params(q, limit, after, filters))
+    with stage("rank"):
+        rows, next_cursor = paginate(rows, limit, "prefix", prefix_key)
+        return [row_to_medicine(row) for row in rows], next_cursor
+
+def _prefix_from_index(q, limit, after):
+    with stage("fetch"):
+        rows = prefix_index.search(q, limit + 1, after)
+    with stage("rank"):
+        rows, next_cursor = paginate(rows, limit, "prefix", prefix_key)
+        return [row_to_medicine(row) for row in rows], next_cursor
 
 @app.get("/search/prefix")
-async def search_prefix(q: str = Query(..., min_length=1, max_length=100)):
-    start_time = time.time()
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT name, manufacturer_name, type, price, pack_size_label, short_composition
-            FROM medicines
-            WHERE name ILIKE %s || '%%'
-            ORDER BY name
-            LIMIT 100
-        """, (q,))
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                "name": row[0],
-                "manufacturer_name": row[1],
-                "type": row[2],
-                "price": row[3],
-                "pack_size_label": row[4],
-                "short_composition": row[5]
-            })
-        cursor.close()
-        conn.close()
-        execution_time = time.time() - start_time
-        return {
-            "query": q,
-            "type": "prefix",
-            "results": results,
-            "count": len(results),
-            "execution_time_ms": round(execution_time * 1000, 2)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+async def search_prefix(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str = Query(None),
+    filters: dict = Depends(filter_params),
+    facets: bool = Query(False)
+):
+    timer = start_timer("prefix")
+    after = decode_cursor("prefix", cursor) if cursor else None
+    facet_counts = search_facets("prefix", q, PREFIX_MATCH, prefix_params(q, filters=filters)) if facets else None
+    # The in-memory index holds no filter columns, filtered searches go to the database
+    if prefix_index.ready and not has_filters(filters):
+        results, next_cursor = _prefix_from_index(q, limit, after)
+        facet_counts = await facet_counts if facet_counts else None
+    else:
+        (results, next_cursor), facet_counts = await gather_facets(cached_search(
+            "prefix", q, lambda: db_pool.run(_prefix_query, q, limit, after, filters),
+            limit=limit, cursor=cursor, **filters
+        ), facet_counts)
+    return search_response(q, "prefix", results, next_cursor, timer, facets=facet_counts)
+
+def _load_suggestions(cursor, version, prefix):
+    with stage("execute"):
+        return suggester.load(cursor, version, prefix, *prefix_bounds(prefix))
+
+@app.get("/suggest")
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Typeahead: the most popular medicine names starting with q, names only"""
+    timer = start_timer("suggest")
+    prefix = q.lower()
+    version = result_cache.data_version
+    with stage("fetch"):
+        candidates = suggester.cached(version, prefix)
+    if candidates is None:
+        candidates = await single_flight.do(
+            f"suggest|v{version}|{prefix}", lambda: db_pool.run(_load_suggestions, version, prefix)
+        )
+    with stage("serialize"):
+        response = ORJSONResponse({"query": q, "suggestions": [name for _, name in candidates[1][:limit]]})
+    timer.finish()
+    if SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timer.server_timing()
+    return response
+
+SUBSTRING_MATCH = "name ILIKE '%%' || %(pattern)s || '%%'"
+SUBSTRING_SQL = f"""
+    SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition, id
+    FROM medicines
+    WHERE {SUBSTRING_MATCH}{FILTER_SQL}
+      AND (name, id) > (%(after_name)s, %(after_id)s)
+    ORDER BY name, id
+    LIMIT %(limit)s
+"""
+
+def substring_params(q, limit=DEFAULT_LIMIT, after=None, filters=None):
+    after_name, after_id = after or ("", 0)
+    return with_filters({"pattern": escape_like(q), "after_name": after_name, "after_id": after_id,
+                         "limit": limit + 1}, filters)
+
+def substring_key(row):
+    return row[0], row[6]
+
+def _substring_query(cursor, q, limit, after, filters=None):
+    rows = fetch_rows(cursor, SUBSTRING_SQL, substring_params(q, limit, after, filters))
+    with stage("rank"):
+        rows, next_cursor = paginate(rows, limit, "substring", substring_key)
+        return [row_to_medicine(row) for row in rows], next_cursor
 
 @app.get("/search/substring")
-async def search_substring(q: str = Query(..., min_length=1, max_length=100)):
-    start_time = time.time()
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT name, manufacturer_name, type, price, pack_size_label, short_composition
-            FROM medicines
-            WHERE name ILIKE '%%' || %s || '%%'
-            ORDER BY name
-            LIMIT 100
-        """, (q,))
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                "name": row[0],
-                "manufacturer_name": row[1],
-                "type": row[2],
-                "price": row[3],
-                "pack_size_label": row[4],
-                "short_composition": row[5]
-            })
-        cursor.close()
-        conn.close()
-        execution_time = time.time() - start_time
-        return {
-            "query": q,
-            "type": "substring",
-            "results": results,
-            "count": len(results),
-            "execution_time_ms": round(execution_time * 1000, 2)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+async def search_substring(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str = Query(None),
+    filters: dict = Depends(filter_params),
+    facets: bool = Query(False)
+):
+    timer = start_timer("substring")
+    after = decode_cursor("substring", cursor) if cursor else None
+    (results, next_cursor), facet_counts = await gather_facets(cached_search(
+        "substring", q, lambda: db_pool.run(_substring_query, q, limit, after, filters),
+        limit=limit, cursor=cursor, **filters
+    ), search_facets("substring", q, SUBSTRING_MATCH, substring_params(q, filters=filters)) if facets else None)
+    return search_response(q, "substring", results, next_cursor, timer, facets=facet_counts)
+
+# Ranked full-text search over the weighted search_vector, served by idx_search_fts.
+# Pages continue after the (-rank, name, id) of the previous page's last row. ts_rank_cd() returns
+# real; rank is cast to float8 so the value a cursor carries compares equal to the row it came from.
+FULLTEXT_MATCH = "search_vector @@ websearch_to_tsquery('english', %(q)s)"
+FULLTEXT_SQL = f"""
+    SELECT * FROM (
+        SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition,
+               ts_rank_cd(search_vector, query, 32)::float8 AS rank, id
+        FROM medicines, websearch_to_tsquery('english', %(q)s) AS query
+        WHERE search_vector @@ query{FILTER_SQL}
+    ) ranked
+    WHERE (-rank, name, id) > (%(after_rank)s, %(after_name)s, %(after_id)s)
+    ORDER BY rank DESC, name, id
+    LIMIT %(limit)s
+"""
+
+def fulltext_params(q, limit=DEFAULT_LIMIT, after=None, filters=None):
+    after_rank, after_name, after_id = after or (float("-inf"), "", 0)
+    return with_filters({"q": q, "after_rank": after_rank, "after_name": after_name, "after_id": after_id,
+                         "limit": limit + 1}, filters)
+
+def fulltext_key(row):
+    return -float(row[6]), row[0], row[7]
+
+def fulltext_result(row):
+    medicine = row_to_medicine(row)
+    medicine["rank"] = float(row[6])
+    return medicine
+
+def _fulltext_query(cursor, q, limit, after, filters=None):
+    rows = fetch_rows(cursor, FULLTEXT_SQL, fulltext_params(q, limit, after, filters))
+    with stage("rank"):
+        rows, next_cursor = paginate(rows, limit, "fulltext", fulltext_key)
+        return [fulltext_result(row) for row in rows], next_cursor
 
 @app.get("/search/fulltext")
-async def search_fulltext(q: str = Query(..., min_length=1, max_length=100)):
-    start_time = time.time()
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Smart search with ranking based on position and exact matches
-        cursor.execute("""
-            SELECT name, manufacturer_name, type, price, pack_size_label, short_composition,
-                   CASE 
-                       WHEN LOWER(name) = LOWER(%s) THEN 1.0
-                       WHEN LOWER(name) LIKE LOWER(%s) || ' %%' THEN 0.9
-                       WHEN LOWER(name) LIKE '%% ' || LOWER(%s) || ' %%' THEN 0.8
-                       WHEN LOWER(name) LIKE '%% ' || LOWER(%s) THEN 0.7
-                       WHEN LOWER(name) LIKE LOWER(%s) || '%%' THEN 0.6
-                       ELSE 0.5 
-                   END as rank
-            FROM medicines
-            WHERE LOWER(name) LIKE '%%' || LOWER(%s) || '%%'
-            ORDER BY rank DESC, name
-            LIMIT 100
-        """, (q, q, q, q, q, q))
-        results = []
-        for row in cursor.fetchall():
-            results.append({
-                "name": row[0],
-                "manufacturer_name": row[1],
-                "type": row[2],
-                "price": row[3],
-                "pack_size_label": row[4],
-                "short_composition": row[5],
-                "rank": float(row[6])
-            })
-        cursor.close()
-        conn.close()
-        execution_time = time.time() - start_time
-        return {
-            "query": q,
-            "type": "fulltext",
-            "results": results,
-            "count": len(results),
-            "execution_time_ms": round(execution_time * 1000, 2)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
-
-def calculate_similarity(s1, s2):
-    """Simple similarity calculation without pg_trgm extension"""
-    s1, s2 = s1.lower(), s2.lower()
-    if s1 == s2:
-        return 1.0
-    
-    # Levenshtein distance approximation
-    len1, len2 = len(s1), len(s2)
-    if len1 == 0: return 0.0
-    if len2 == 0: return 0.0
-    
-    # Simple character overlap
-    common_chars = set(s1) & set(s2)
-    max_len = max(len1, len2)
-    overlap_score = len(common_chars) / max_len
-    
-    # Length difference penalty
-    length_diff = abs(len1 - len2) / max_len
-    length_score = 1 - length_diff
-    
-    # Substring bonus
-    substring_bonus = 0
-    if s1 in s2 or s2 in s1:
-        substring_bonus = 0.3
-    
-    return min(1.0, overlap_score * 0.6 + length_score * 0.4 + substring_bonus)
+async def search_fulltext(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str = Query(None),
+    filters: dict = Depends(filter_params),
+    facets: bool = Query(False)
+):
+    timer = start_timer("fulltext")
+    after = decode_cursor("fulltext", cursor) if cursor else None
+    (results, next_cursor), facet_counts = await gather_facets(cached_search(
+        "fulltext", q, lambda: db_pool.run(_fulltext_query, q, limit, after, filters),
+        limit=limit, cursor=cursor, **filters
+    ), search_facets("fulltext", q, FULLTEXT_MATCH, fulltext_params(q, filters=filters)) if facets else None)
+    return search_response(q, "fulltext", results, next_cursor, timer, facets=facet_counts)
+
+# Trigram word-similarity search: candidate filter and top-k KNN ordering both run on idx_name_trgm_gist.
+# <<-> returns real: the cursor comparison uses its float8 cast, like the distance column, while
+# ORDER BY keeps the bare operator the KNN index scan needs (the cast preserves the order).
+FUZZY_MATCH = "%(q)s <%% name"
+FUZZY_SETUP = "SET pg_trgm.word_similarity_threshold = %(threshold)s;"
+FUZZY_SQL = f"""
+    SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition,
+           word_similarity(%(q)s, name) AS similarity, (%(q)s <<-> name)::float8 AS distance, id
+    FROM medicines
+    WHERE {FUZZY_MATCH}{FILTER_SQL}
+      AND ((%(q)s <<-> name)::float8, name, id) > (%(after_distance)s, %(after_name)s, %(after_id)s)
+    ORDER BY %(q)s <<-> name, name, id
+    LIMIT %(limit)s
+"""
+
+def fuzzy_params(q, limit=DEFAULT_LIMIT, after=None, threshold=None, filters=None):
+    after_distance, after_name, after_id = after or (-1.0, "", 0)
+    return with_filters({"q": q, "after_distance": after_distance, "after_name": after_name, "after_id": after_id,
+                         "limit": limit + 1, "threshold": FUZZY_THRESHOLD if threshold is None else threshold},
+                        filters)
+
+def fuzzy_key(row):
+    return row[7], row[0], row[8]
+
+def fuzzy_result(row):
+    medicine = row_to_medicine(row)
+    medicine["similarity_score"] = round(float(row[6]), 4)
+    return medicine
+
+def _fuzzy_query(cursor, q, threshold, limit, after, filters=None):
+    rows = fetch_rows(cursor, FUZZY_SQL, fuzzy_params(q, limit, after, threshold, filters), setup=FUZZY_SETUP)
+    with stage("rank"):
+        rows, next_cursor = paginate(rows, limit, "fuzzy", fuzzy_key)
+        return [fuzzy_result(row) for row in rows], next_cursor
 
 @app.get("/search/fuzzy")
-async def search_fuzzy(q: str = Query(..., min_length=1, max_length=100)):
-    start_time = time.time()
+async def search_fuzzy(
+    q: str = Query(..., min_length=1, max_length=100),
+    threshold: float = Query(None, ge=0.0, le=1.0),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str = Query(None),
+    filters: dict = Depends(filter_params),
+    facets: bool = Query(False)
+):
+    timer = start_timer("fuzzy")
+    if threshold is None:
+        threshold = FUZZY_THRESHOLD
+    after = decode_cursor("fuzzy", cursor) if cursor else None
+    (results, next_cursor), facet_counts = await gather_facets(cached_search(
+        "fuzzy", q, lambda: db_pool.run(_fuzzy_query, q, threshold, limit, after, filters),
+        threshold=threshold, limit=limit, cursor=cursor, **filters
+    ), search_facets(
+        "fuzzy", q, FUZZY_MATCH, fuzzy_params(q, threshold=threshold, filters=filters), FUZZY_SETUP
+    ) if facets else None)
+    return search_response(q, "fuzzy", results, next_cursor, timer, facets=facet_counts)
+
+# Medicines containing every requested ingredient: each term is a prefix range on ingredients.name,
+# and the posting lists in medicine_ingredients are intersected by counting matched terms per medicine
+INGREDIENT_IDS = """
+        SELECT mi.medicine_id
+        FROM unnest(%(lows)s::text[], %(highs)s::text[]) WITH ORDINALITY AS t(low, high, term)
+        JOIN ingredients i ON i.name >= t.low COLLATE "C" AND i.name < t.high COLLATE "C"
+        JOIN medicine_ingredients mi ON mi.ingredient_id = i.id
+        GROUP BY mi.medicine_id
+        HAVING count(DISTINCT t.term) = %(terms)s"""
+INGREDIENT_MATCH = f"""id IN ({INGREDIENT_IDS}
+    )"""
+# The matched ids drive primary-key lookups into medicines. LIMIT 1 keeps the planner from flattening
+# the lookup into a join, which it would answer with a hash join over a full scan of medicines.
+INGREDIENT_SQL = f"""
+    SELECT m.*
+    FROM ({INGREDIENT_IDS}
+    ) matched
+    CROSS JOIN LATERAL (
+        SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition, id
+        FROM medicines
+        WHERE id = matched.medicine_id{FILTER_SQL}
+          AND (name, id) > (%(after_name)s, %(after_id)s)
+        LIMIT 1
+    ) m
+    ORDER BY m.name, m.id
+    LIMIT %(limit)s
+"""
+
+def ingredient_terms(q):
+    """'Paracetamol + caffeine' or 'paracetamol, caffeine' -> normalized ingredient terms"""
+    terms = []
+    for part in split_components(q.replace(",", "+")):
+        term = normalize_ingredient(part)
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+def ingredient_params(terms, limit=DEFAULT_LIMIT, after=None, filters=None):
+    bounds = [prefix_bounds(term) for term in terms]
+    after_name, after_id = after or ("", 0)
+    return with_filters({"lows": [low for low, _ in bounds], "highs": [high for _, high in bounds],
+                         "terms": len(terms), "after_name": after_name, "after_id": after_id,
+                         "limit": limit + 1}, filters)
+
+def ingredient_key(row):
+    return row[0], row[6]
+
+def _ingredient_query(cursor, terms, limit, after, filters=None):
+    rows = fetch_rows(cursor, INGREDIENT_SQL, ingredient_params(terms, limit, after, filters))
+    with stage("rank"):
+        rows, next_cursor = paginate(rows, limit, "ingredient", ingredient_key)
+        return [row_to_medicine(row) for row in rows], next_cursor
+
+@app.get("/search/ingredient")
+async def search_ingredient(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str = Query(None),
+    filters: dict = Depends(filter_params),
+    facets: bool = Query(False)
+):
+    """Medicines containing all of the given active ingredients (separated by '+' or ',')"""
+    timer = start_timer("ingredient")
+    terms = ingredient_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="No ingredient names in query")
+    after = decode_cursor("ingredient", cursor) if cursor else None
+    key = " + ".join(terms)
+    (results, next_cursor), facet_counts = await gather_facets(cached_search(
+        "ingredient", key, lambda: db_pool.run(_ingredient_query, terms, limit, after, filters),
+        limit=limit, cursor=cursor, **filters
+    ), search_facets("ingredient", key, INGREDIENT_MATCH, ingredient_params(terms, filters=filters))
+       if facets else None)
+    return search_response(q, "ingredient", results, next_cursor, timer, facets=facet_counts)
+
+# The product substitutes are looked up for: first medicine with exactly this name
+REFERENCE_SQL = """
+    SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition, id
+    FROM medicines
+    WHERE name_lower = lower(%(name)s)
+    ORDER BY id
+    LIMIT 1
+"""
+
+# Medicines whose ingredient set equals the reference's: intersect the reference's posting lists,
+# keep medicines that matched every ingredient and have no others. Cheapest first.
+SUBSTITUTES_SQL = f"""
+    WITH wanted AS (
+        SELECT ingredient_id, strength FROM medicine_ingredients WHERE medicine_id = %(reference_id)s
+    )
+    SELECT m.name, m.manufacturer_name, m.type, m.price::float8 AS price, m.pack_size_label,
+           m.short_composition, coalesce(m.price::float8, 'Infinity') AS price_key, m.id
+    FROM (
+        SELECT mi.medicine_id
+        FROM wanted w
+        JOIN medicine_ingredients mi ON mi.ingredient_id = w.ingredient_id
+         AND (NOT %(same_strength)s OR mi.strength IS NOT DISTINCT FROM w.strength)
+        GROUP BY mi.medicine_id
+        HAVING count(*) = (SELECT count(*) FROM wanted)
+    ) matched
+    JOIN medicines m ON m.id = matched.medicine_id
+    WHERE m.id <> %(reference_id)s{FILTER_SQL}
+      AND (SELECT count(*) FROM medicine_ingredients x WHERE x.medicine_id = m.id) = (SELECT count(*) FROM wanted)
+      AND (coalesce(m.price::float8, 'Infinity'), m.name, m.id) > (%(after_price)s, %(after_name)s, %(after_id)s)
+    ORDER BY price_key, m.name, m.id
+    LIMIT %(limit)s
+"""
+
+def substitutes_params(reference_id, same_strength=True, limit=DEFAULT_LIMIT, after=None, filters=None):
+    after_price, after_name, after_id = after or (float("-inf"), "", 0)
+    return with_filters({"reference_id": reference_id, "same_strength": same_strength, "after_price": after_price,
+                         "after_name": after_name, "after_id": after_id, "limit": limit + 1}, filters)
+
+def substitutes_key(row):
+    return row[6], row[0], row[7]
+
+def _substitutes_query(cursor, name, same_strength, limit, after, filters=None):
+    """Returns (reference medicine or None, substitutes, next cursor)"""
+    reference = fetch_rows(cursor, REFERENCE_SQL, {"name": name})
+    if not reference:
+        return None, [], None
+    rows = fetch_rows(cursor, SUBSTITUTES_SQL, substitutes_params(reference[0][-1], same_strength, limit, after, filters))
+    with stage("rank"):
+        rows, next_cursor = paginate(rows, limit, "substitutes", substitutes_key)
+        return row_to_medicine(reference[0]), [row_to_medicine(row) for row in rows], next_cursor
+
+@app.get("/search/substitutes")
+async def search_substitutes(
+    q: str = Query(..., min_length=1, max_length=500),
+    same_strength: bool = Query(True),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str = Query(None),
+    filters: dict = Depends(filter_params)
+):
+    """Other products with the same active ingredients as the medicine named q, cheapest first"""
+    timer = start_timer("substitutes")
+    after = decode_cursor("substitutes", cursor) if cursor else None
+    reference, results, next_cursor = await cached_search(
+        "substitutes", q, lambda: db_pool.run(_substitutes_query, q, same_strength, limit, after, filters),
+        same_strength=same_strength, limit=limit, cursor=cursor, **filters
+    )
+    if reference is None:
+        raise HTTPException(status_code=404, detail=f"No medicine named '{q}'")
+    return search_response(q, "substitutes", results, next_cursor, timer, reference=reference)
+
+# Each strategy's first page as (id, result) pairs; id is the last column of every search query
+def _prefix_ranked(cursor, q, limit, filters):
+    rows = fetch_rows(cursor, PREFIX_SQL, prefix_params(q, limit, filters=filters))
+    return [(row[-1], row_to_medicine(row)) for row in rows]
+
+def _fulltext_ranked(cursor, q, limit, filters):
+    rows = fetch_rows(cursor, FULLTEXT_SQL, fulltext_params(q, limit, filters=filters))
+    return [(row[-1], fulltext_result(row)) for row in rows]
+
+def _fuzzy_ranked(cursor, q, limit, filters):
+    rows = fetch_rows(cursor, FUZZY_SQL, fuzzy_params(q, limit, filters=filters), setup=FUZZY_SETUP)
+    return [(row[-1], fuzzy_result(row)) for row in rows]
+
+async def _run_strategy(name, q, limit, filters):
+    """One /search branch, cut off (and its query cancelled) once the strategy's budget runs out"""
+    start = time.perf_counter()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Get a broader set of potential matches for fuzzy search
-        cursor.execute("""
-            SELECT name, manufacturer_name, type, price, pack_size_label, short_composition
-            FROM medicines
-            WHERE LOWER(name) LIKE '%%' || LOWER(%s) || '%%'
-               OR LOWER(name) LIKE '%%' || LOWER(SUBSTRING(%s, 1, 3)) || '%%'
-            LIMIT 200
-        """, (q, q))
-        
-        raw_results = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        # Calculate similarity scores in Python
-        results = []
-        for row in raw_results:
-            similarity = calculate_similarity(q, row[0])
-            if similarity > 0.1:  # Filter threshold
-                results.append({
-                    "name": row[0],
-                    "manufacturer_name": row[1],
-                    "type": row[2],
-                    "price": row[3],
-                    "pack_size_label": row[4],
-                    "short_composition": row[5],
-                    "similarity_score": similarity
-                })
-        
-        # Sort by similarity score
-        results.sort(key=lambda x: x["similarity_score"], reverse=True)
-        results = results[:100]  # Limit to 100
-        
-        execution_time = time.time() - start_time
-        return {
-            "query": q,
-            "type": "fuzzy",
-            "results": results,
-            "count": len(results),
-            "execution_time_ms": round(execution_time * 1000, 2)
-        }
+        if name == "prefix" and prefix_index.ready and not has_filters(filters):
+            ranked = [(row[-1], row_to_medicine(row)) for row in prefix_index.search(q, limit)]
+        else:
+            fn = {"prefix": _prefix_ranked, "fulltext": _fulltext_ranked, "fuzzy": _fuzzy_ranked}[name]
+            ranked = await db_pool.run_with_deadline(SEARCH_BUDGETS[name], fn, q, limit, filters)
+        status = "ok"
+    except asyncio.TimeoutError:
+        ranked, status = [], "timeout"
+    except PoolTimeoutError:
+        ranked, status = [], "unavailable"
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+        print(f"{name} branch of /search failed: {e}")
+        ranked, status = [], "error"
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+    return ranked, {"status": status, "count": len(ranked), "time_ms": elapsed_ms}
+
+@app.get("/search")
+async def search_all(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    filters: dict = Depends(filter_params)
+):
+    """Prefix, full-text and fuzzy search in one round trip, merged by reciprocal-rank fusion"""
+    timer = start_timer("all")
+    key = result_cache.key("all", q, limit=limit, **filters)
+    cached = result_cache.get(key)
+    if cached is None:
+        cached = await single_flight.do(key, lambda: _search_all(key, q, limit, filters))
+    results, strategies = cached
+    return search_response(q, "all", results, None, timer, strategies=strategies)
+
+async def _search_all(key, q, limit, filters):
+    names = list(SEARCH_BUDGETS)
+    outcomes = await asyncio.gather(*(_run_strategy(name, q, limit, filters) for name in names))
+    strategies = {name: info for name, (_, info) in zip(names, outcomes)}
+    if all(info["status"] != "ok" for info in strategies.values()):
+        if any(info["status"] == "unavailable" for info in strategies.values()):
+            raise HTTPException(status_code=503, detail="No database connection available")
+        raise HTTPException(status_code=500, detail="Search failed")
+
+    with stage("rank"):
+        fused = reciprocal_rank_fusion(
+            {name: ranked for name, (ranked, _) in zip(names, outcomes)}, FUSION_WEIGHTS
+        )
+        results = []
+        for score, matched_by, medicine in fused[:limit]:
+            medicine["score"] = round(score, 6)
+            medicine["matched_by"] = matched_by
+            results.append(medicine)
+    # Partial answers (a branch ran out of budget) aren't cached, the next request gets another try
+    if all(info["status"] == "ok" for info in strategies.values()):
+        result_cache.set(key, (results, strategies))
+    return results, strategies
+
+# Set-based versions of the search queries for /search/batch: one row per (item, match), with the
+# item's 1-based position in the unnest()ed arrays appended as the last column
+PREFIX_BATCH_SQL = """
+    SELECT m.*, b.ord
+    FROM unnest(%(lows)s::text[], %(highs)s::text[], %(limits)s::int[]) WITH ORDINALITY AS b(low, high, lim, ord)
+    CROSS JOIN LATERAL (
+        SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition, name_lower, id
+        FROM medicines
+        WHERE name_lower >= b.low COLLATE "C" AND name_lower < b.high COLLATE "C"
+        ORDER BY name_lower, id
+        LIMIT b.lim
+    ) m
+    ORDER BY b.ord, m.name_lower, m.id
+"""
+
+SUBSTRING_BATCH_SQL = """
+    SELECT m.*, b.ord
+    FROM unnest(%(patterns)s::text[], %(limits)s::int[]) WITH ORDINALITY AS b(pattern, lim, ord)
+    CROSS JOIN LATERAL (
+        SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition, id
+        FROM medicines
+        WHERE name ILIKE '%%' || b.pattern || '%%'
+        ORDER BY name, id
+        LIMIT b.lim
+    ) m
+    ORDER BY b.ord, m.name, m.id
+"""
+
+FULLTEXT_BATCH_SQL = """
+    SELECT m.*, b.ord
+    FROM unnest(%(queries)s::text[], %(limits)s::int[]) WITH ORDINALITY AS b(q, lim, ord)
+    CROSS JOIN LATERAL (
+        SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition,
+               ts_rank_cd(search_vector, query, 32)::float8 AS rank, id
+        FROM medicines, websearch_to_tsquery('english', b.q) AS query
+        WHERE search_vector @@ query
+        ORDER BY rank DESC, name, id
+        LIMIT b.lim
+    ) m
+    ORDER BY b.ord, m.rank DESC, m.name, m.id
+"""
+
+FUZZY_BATCH_SQL = """
+    SELECT m.*, b.ord
+    FROM unnest(%(queries)s::text[], %(limits)s::int[]) WITH ORDINALITY AS b(q, lim, ord)
+    CROSS JOIN LATERAL (
+        SELECT name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition,
+               word_similarity(b.q, name) AS similarity, (b.q <<-> name)::float8 AS distance, id
+        FROM medicines
+        WHERE b.q <%% name
+        ORDER BY b.q <<-> name, name, id
+        LIMIT b.lim
+    ) m
+    ORDER BY b.ord, m.distance, m.name, m.id
+"""
+
+def prefix_batch_params(items):
+    bounds = [prefix_bounds(item.query) for item in items]
+    return {"lows": [low for low, _ in bounds], "highs": [high for _, high in bounds],
+            "limits": [item.limit + 1 for item in items]}
+
+def substring_batch_params(items):
+    return {"patterns": [escape_like(item.query) for item in items], "limits": [item.limit + 1 for item in items]}
+
+def text_batch_params(items):
+    return {"queries": [item.query for item in items], "limits": [item.limit + 1 for item in items],
+            "threshold": FUZZY_THRESHOLD}
+
+# search type -> (sql, params builder, setup statement, sort key, result builder)
+BATCH_QUERIES = {
+    "prefix": (PREFIX_BATCH_SQL, prefix_batch_params, None, prefix_key, row_to_medicine),
+    "substring": (SUBSTRING_BATCH_SQL, substring_batch_params, None, substring_key, row_to_medicine),
+    "fulltext": (FULLTEXT_BATCH_SQL, text_batch_params, None, fulltext_key, fulltext_result),
+    "fuzzy": (FUZZY_BATCH_SQL, text_batch_params, "SET pg_trgm.word_similarity_threshold = %(threshold)s;",
+              fuzzy_key, fuzzy_result),
+}
+
+class BatchItem(BaseModel):
+    type: Literal["prefix", "substring", "fulltext", "fuzzy"]
+    query: str = Field(..., min_length=1, max_length=100)
+    limit: int = Field(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+
+def _batch_query(cursor, sql, params, size, setup):
+    """Run one set-based batch query and split its rows back out per item"""
+    grouped = [[] for _ in range(size)]
+    for row in fetch_rows(cursor, sql, params, setup):
+        grouped[row[-1] - 1].append(row[:-1])
+    return grouped
+
+async def _run_batch_window(items, semaphore):
+    """Answer consecutive batch items with one set-based query per search type among them"""
+    answers = [None] * len(items)
+    by_type = {}
+    for offset, item in enumerate(items):
+        by_type.setdefault(item.type, []).append(offset)
+
+    async def run_group(search_type, offsets):
+        sql, build_params, setup, sort_key, to_result = BATCH_QUERIES[search_type]
+        group = [items[i] for i in offsets]
+        try:
+            async with semaphore:
+                grouped = await db_pool.run(_batch_query, sql, build_params(group), len(group), setup)
+        except (PoolTimeoutError, NotImplementedError) as e:
+            grouped, error = None, str(e)
+        except Exception as e:
+            grouped, error = None, f"Search failed: {str(e)}"
+        for offset, item, rows in zip(offsets, group, grouped or [None] * len(group)):
+            if rows is None:
+                answers[offset] = {"error": error}
+                continue
+            rows, next_cursor = paginate(rows, item.limit, search_type, sort_key)
+            results = [to_result(row) for row in rows]
+            answers[offset] = {"results": results, "count": len(results), "next_cursor": next_cursor}
+
+    await asyncio.gather(*(run_group(search_type, offsets) for search_type, offsets in by_type.items()))
+    return answers
+
+@app.post("/search/batch")
+async def search_batch(request: BatchRequest):
+    """Run many searches in one request, streamed back as NDJSON lines in request order.
+
+    Items are taken in windows of BATCH_WINDOW; each window costs one query per search type
+    it contains, and at most BATCH_CONCURRENCY windows are in flight, so a large batch neither
+    floods the pool nor buffers all of its results before the first line is sent.
+    """
+    items = request.items
+    if not 1 <= len(items) <= BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch must contain between 1 and {BATCH_MAX_ITEMS} items")
+    timer = start_timer("batch")
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def stream():
+        pending = []
+        next_start = 0
+        try:
+            while next_start < len(items) or pending:
+                while next_start < len(items) and len(pending) < BATCH_CONCURRENCY:
+                    window = items[next_start:next_start + BATCH_WINDOW]
+                    pending.append((next_start, asyncio.create_task(_run_batch_window(window, semaphore))))
+                    next_start += len(window)
+                start, task = pending.pop(0)
+                answers = await task
+                with stage("serialize"):
+                    lines = [
+                        orjson.dumps({"index": start + offset, "type": items[start + offset].type,
+                                      "query": items[start + offset].query, **answer})
+                        for offset, answer in enumerate(answers)
+                    ]
+                yield b"\n".join(lines) + b"\n"
+        finally:
+            # Client went away mid-stream: don't keep querying for windows nobody will read
+            for _, task in pending:
+                task.cancel()
+            timer.finish()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# The memory backend answers these statements itself; anything else (facets, ingredient and
+# substitute search, /suggest, /search/batch) still needs SEARCH_BACKEND=postgres
+if SEARCH_BACKEND == "memory":
+    db_pool.route(PREFIX_SQL, "prefix")
+    db_pool.route(SUBSTRING_SQL, "substring")
+    db_pool.route(FULLTEXT_SQL, "fulltext")
+    db_pool.route(FUZZY_SQL, "fuzzy")
+    db_pool.route(PING_SQL, "ping")
+    db_pool.route(CATALOG_SQL, "catalog")
+    db_pool.route(INDEX_SIZES_SQL, "index_sizes")
+    db_pool.route(DATA_VERSION_SQL, "data_version")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    from serve import main
+    main()
\ No newline at end of file
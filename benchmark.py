@@ -1,12 +1,46 @@
+import argparse
 import json
+import math
+import random
+import subprocess
+import sys
+import threading
 import time
 import requests
 import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from typing import Dict, List
 import os
 
+DEFAULT_API_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+RUNS_DIR = "benchmark_runs"
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def latency_summary(latencies: List[float], errors: int, seconds: float) -> Dict:
+    ordered = sorted(latencies)
+    total = len(ordered) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / seconds, 2) if seconds else 0.0,
+        "mean_ms": round(statistics.mean(ordered), 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50), 3),
+        "p90_ms": round(percentile(ordered, 90), 3),
+        "p99_ms": round(percentile(ordered, 99), 3),
+        "p99_9_ms": round(percentile(ordered, 99.9), 3),
+        "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+    }
+
 class BenchmarkRunner:
-    def __init__(self, api_base_url: str = "http://localhost:8001"):
+    def __init__(self, api_base_url: str = DEFAULT_API_URL):
         self.api_base_url = api_base_url
         self.results = {}
 
@@ -22,7 +56,8 @@ class BenchmarkRunner:
             query_list.append({
                 'id': int(query_id),
                 'type': query_data['type'],
-                'query': query_data['query']
+                'query': query_data['query'],
+                'weight': float(query_data.get('weight', 1.0))
             })
         return query_list
 
@@ -35,7 +70,7 @@ class BenchmarkRunner:
         results = None
 
         for _ in range(iterations):
-            start_time = time.time()
+            start_time = time.perf_counter()
             try:
                 response = requests.get(url, params={"q": query}, timeout=10)
                 response.raise_for_status()
@@ -44,7 +79,7 @@ class BenchmarkRunner:
                 print(f"Error running query {query_type}:{query} - {e}")
                 continue
 
-            end_time = time.time()
+            end_time = time.perf_counter()
             latency = (end_time - start_time) * 1000  # Convert to milliseconds
             latencies.append(latency)
 
@@ -54,6 +89,7 @@ class BenchmarkRunner:
                 "min_latency_ms": min(latencies),
                 "max_latency_ms": max(latencies),
                 "std_dev_ms": statistics.stdev(latencies) if len(latencies) > 1 else 0,
+                "latencies_ms": latencies,
                 "results_count": len(results.get("results", [])) if results else 0,
                 "results": [r.get("name") for r in results.get("results", [])] if results else []
             }
@@ -63,12 +99,14 @@ class BenchmarkRunner:
                 "results": []
             }
 
-    def run_benchmarks(self, queries_file: str, output_file: str = "benchmark_results.json"):
-        """Run all benchmark queries and save results"""
+    def run_benchmarks(self, queries_file: str, output_file: str = "benchmark_results.json",
+                       iterations: int = 5, runs_dir: str = RUNS_DIR):
+        """Run all benchmark queries and save results, plus a timestamped copy in runs_dir"""
         queries = self.load_benchmark_queries(queries_file)
 
         print("Running benchmarks...")
         benchmark_data = {}
+        latency_data = {}
 
         for query in queries:
             query_id = str(query['id'])
@@ -77,7 +115,13 @@ class BenchmarkRunner:
 
             print(f"Running query {query_id}: {query_type} - '{query_text}'")
 
-            result = self.run_single_query(query_type, query_text)
+            result = self.run_single_query(query_type, query_text, iterations)
+            if "latencies_ms" in result:
+                latency_data[query_id] = {
+                    "type": query_type,
+                    "query": query_text,
+                    **{k: v for k, v in result.items() if k != "results"},
+                }
 
             if query_id not in benchmark_data:
                 benchmark_data[query_id] = []
@@ -88,10 +132,23 @@ class BenchmarkRunner:
             benchmark_data[query_id] = list(dict.fromkeys(benchmark_data[query_id]))
 
         # Save benchmark results
+        started = datetime.now(timezone.utc)
+        run = {
+            "timestamp": started.isoformat(),
+            "api_base_url": self.api_base_url,
+            "iterations": iterations,
+            "results": benchmark_data,
+            "latency": latency_data,
+        }
         with open(output_file, 'w') as f:
-            json.dump({"results": benchmark_data}, f, indent=2)
+            json.dump(run, f, indent=2)
 
-        print(f"Benchmark results saved to {output_file}")
+        os.makedirs(runs_dir, exist_ok=True)
+        run_file = os.path.join(runs_dir, f"run-{started.strftime('%Y%m%dT%H%M%SZ')}.json")
+        with open(run_file, 'w') as f:
+            json.dump(run, f, indent=2)
+
+        print(f"Benchmark results saved to {output_file} and {run_file}")
         return benchmark_data
 
     def generate_submission_json(self, benchmark_results: Dict, output_file: str = "submission.json"):
@@ -105,10 +162,177 @@ class BenchmarkRunner:
 
         print(f"Submission file generated: {output_file}")
 
+    def run_load(self, queries: List[Dict], concurrency: int = 16, duration: float = 30.0,
+                 warmup: float = 5.0, type_weights: Dict[str, float] = None) -> Dict:
+        """Hammer the API from `concurrency` threads for warmup + duration seconds.
+
+        Each request picks a query from the weighted mix; requests that finish during
+        warmup are discarded. Reports throughput, latency percentiles and error rate per type.
+        """
+        type_weights = type_weights or {}
+        mix = [q for q in queries if type_weights.get(q['type'], 1.0) > 0]
+        weights = [q['weight'] * type_weights.get(q['type'], 1.0) for q in mix]
+        if not mix:
+            raise ValueError("Query mix is empty")
+
+        samples = {}  # type -> ([latencies], errors)
+        lock = threading.Lock()
+        started = time.perf_counter()
+        measure_from = started + warmup
+        stop_at = measure_from + duration
+
+        def worker(seed):
+            rng = random.Random(seed)
+            session = requests.Session()
+            local = {}
+            while True:
+                now = time.perf_counter()
+                if now >= stop_at:
+                    break
+                query = rng.choices(mix, weights)[0]
+                url = f"{self.api_base_url}/search/{query['type']}"
+                ok = True
+                try:
+                    response = session.get(url, params={"q": query['query']}, timeout=10)
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                finished = time.perf_counter()
+                if now < measure_from or finished > stop_at:
+                    continue
+                latencies, errors = local.setdefault(query['type'], ([], [0]))
+                if ok:
+                    latencies.append((finished - now) * 1000)
+                else:
+                    errors[0] += 1
+            session.close()
+            with lock:
+                for query_type, (latencies, errors) in local.items():
+                    merged = samples.setdefault(query_type, ([], [0]))
+                    merged[0].extend(latencies)
+                    merged[1][0] += errors[0]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, range(concurrency)))
+
+        all_latencies = [l for latencies, _ in samples.values() for l in latencies]
+        all_errors = sum(errors[0] for _, errors in samples.values())
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "api_base_url": self.api_base_url,
+            "config": {
+                "concurrency": concurrency,
+                "duration_s": duration,
+                "warmup_s": warmup,
+                "type_weights": type_weights,
+            },
+            "overall": latency_summary(all_latencies, all_errors, duration),
+            "by_type": {
+                query_type: latency_summary(latencies, errors[0], duration)
+                for query_type, (latencies, errors) in sorted(samples.items())
+            },
+        }
+
+def print_load_report(report: Dict):
+    header = f"{'type':<12}{'reqs':>8}{'rps':>10}{'p50':>9}{'p90':>9}{'p99':>9}{'p99.9':>9}{'err%':>8}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["by_type"].items()) + [("overall", report["overall"])]
+    for name, s in rows:
+        print(f"{name:<12}{s['requests']:>8}{s['throughput_rps']:>10.1f}{s['p50_ms']:>9.2f}"
+              f"{s['p90_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['p99_9_ms']:>9.2f}{s['error_rate'] * 100:>7.2f}%")
+
+def wait_until_ready(api_base_url: str, timeout: float = 120.0) -> bool:
+    """Poll /readyz until the server answers 200 (workers warmed up) or the timeout passes"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(f"{api_base_url}/readyz", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+def run_scale(queries: List[Dict], worker_counts: List[int], port: int, concurrency: int, duration: float,
+              warmup: float, type_weights: Dict[str, float]) -> Dict:
+    """Start serve.py with each worker count in turn and load-test it, to show throughput scaling across cores"""
+    api_base_url = f"http://127.0.0.1:{port}"
+    runs = []
+    for workers in worker_counts:
+        print(f"\n== {workers} worker(s) ==")
+        server = subprocess.Popen([sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+                                   "--workers", str(workers)])
+        try:
+            if not wait_until_ready(api_base_url):
+                print(f"Server with {workers} worker(s) did not become ready, skipped")
+                continue
+            report = BenchmarkRunner(api_base_url).run_load(queries, concurrency, duration, warmup, type_weights)
+            print_load_report(report)
+            runs.append({"workers": workers, **report})
+        finally:
+            # SIGTERM: the launcher drains in-flight requests before exiting
+            server.terminate()
+            server.wait(timeout=120)
+    return {"timestamp": datetime.now(timezone.utc).isoformat(), "cpu_count": os.cpu_count(), "runs": runs}
+
+def print_scale_report(report: Dict):
+    runs = report["runs"]
+    if not runs:
+        return
+    base_rps = runs[0]["overall"]["throughput_rps"]
+    header = f"{'workers':>8}{'rps':>10}{'speedup':>9}{'p50':>9}{'p99':>9}{'err%':>8}"
+    print(f"\nThroughput by worker count ({report['cpu_count']} CPUs)")
+    print(header)
+    print("-" * len(header))
+    for run in runs:
+        s = run["overall"]
+        speedup = s["throughput_rps"] / base_rps if base_rps else 0.0
+        print(f"{run['workers']:>8}{s['throughput_rps']:>10.1f}{speedup:>8.2f}x{s['p50_ms']:>9.2f}"
+              f"{s['p99_ms']:>9.2f}{s['error_rate'] * 100:>7.2f}%")
+
+def parse_type_weights(spec: str) -> Dict[str, float]:
+    """Parse 'prefix=5,fuzzy=1' into {'prefix': 5.0, 'fuzzy': 1.0}"""
+    weights = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        weights[name.strip()] = float(value)
+    return weights
+
 def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Medicine Search API")
+    parser.add_argument("mode", nargs="?", default="run", choices=["run", "load", "scale"],
+                        help="run: replay benchmark queries and write submission.json; load: concurrent load test; "
+                             "scale: start serve.py at each --scale-workers count and load-test it")
+    parser.add_argument("--url", default=DEFAULT_API_URL, help="API base URL")
+    parser.add_argument("--queries", default="benchmark_queries.json", help="Benchmark query file")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (load mode)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds (load mode)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured warmup seconds (load mode)")
+    parser.add_argument("--mix", default="", help="Per-type weights, e.g. prefix=5,fulltext=1 (load mode)")
+    parser.add_argument("--iterations", type=int, default=5, help="Requests per query (run mode)")
+    parser.add_argument("--scale-workers", default="1,2,4", help="Worker counts to compare (scale mode)")
+    parser.add_argument("--scale-port", type=int, default=8100, help="Port for the servers it starts (scale mode)")
+    parser.add_argument("--output", default=None, help="Where to write results JSON")
+    args = parser.parse_args()
+
+    if args.mode == "scale":
+        # Starts its own servers, so no running API is needed
+        queries = BenchmarkRunner().load_benchmark_queries(args.queries)
+        worker_counts = [int(count) for count in args.scale_workers.split(",")]
+        print(f"Scaling test: {args.concurrency} clients, {args.warmup}s warmup + {args.duration}s measured per run")
+        report = run_scale(queries, worker_counts, args.scale_port, args.concurrency, args.duration, args.warmup,
+                           parse_type_weights(args.mix))
+        print_scale_report(report)
+        output_file = args.output or "scale_results.json"
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nScaling results saved to {output_file}")
+        return
+
     # Check if API is running
     try:
-        response = requests.get("http://localhost:8000/health", timeout=5)
+        response = requests.get(f"{args.url}/health", timeout=5)
         if response.status_code != 200:
             print("API server is not running. Please start the server first.")
             return
@@ -116,18 +340,29 @@ def main():
         print("Cannot connect to API server. Please start the server first.")
         return
 
-    # Run benchmarks
-    runner = BenchmarkRunner()
+    runner = BenchmarkRunner(args.url)
 
     # Path to benchmark queries
-    benchmark_file = "benchmark_queries.json"
+    benchmark_file = args.queries
 
     if not os.path.exists(benchmark_file):
         print(f"Benchmark file not found: {benchmark_file}")
         return
 
+    if args.mode == "load":
+        queries = runner.load_benchmark_queries(benchmark_file)
+        print(f"Load test: {args.concurrency} clients, {args.warmup}s warmup + {args.duration}s measured")
+        report = runner.run_load(queries, args.concurrency, args.duration, args.warmup,
+                                 parse_type_weights(args.mix))
+        print_load_report(report)
+        output_file = args.output or "load_results.json"
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nLoad test results saved to {output_file}")
+        return
+
     # Run benchmarks and generate submission
-    results = runner.run_benchmarks(benchmark_file)
+    results = runner.run_benchmarks(benchmark_file, args.output or "benchmark_results.json", args.iterations)
     runner.generate_submission_json(results)
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import argparse
+import glob
+import json
+import math
+import os
+import shutil
+import statistics
+import sys
+
+from benchmark import RUNS_DIR
+
+BASELINE_FILE = "benchmark_baseline.json"
+
+def mann_whitney_greater(new, base):
+    """One-sided Mann-Whitney U p-value that `new` latencies tend to be larger than `base`.
+
+    Uses the normal approximation with tie and continuity correction, which is adequate
+    from about five samples per side.
+    """
+    n1, n2 = len(new), len(base)
+    if not n1 or not n2:
+        return 1.0
+    combined = sorted([(v, 0) for v in new] + [(v, 1) for v in base])
+    n = n1 + n2
+    rank_sum_new = 0.0
+    tie_term = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        average_rank = (i + j) / 2 + 1
+        ties = j - i + 1
+        tie_term += ties ** 3 - ties
+        rank_sum_new += average_rank * sum(1 for k in range(i, j + 1) if combined[k][1] == 0)
+        i = j + 1
+
+    u = rank_sum_new - n1 * (n1 + 1) / 2
+    mean = n1 * n2 / 2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - mean - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def compare_latency(base, new, threshold_pct, alpha):
+    """Per-query latency comparison; a regression is a slower median that is also significant"""
+    rows = []
+    for query_id, base_entry in base.get("latency", {}).items():
+        new_entry = new.get("latency", {}).get(query_id)
+        if not new_entry:
+            continue
+        base_samples = base_entry.get("latencies_ms", [])
+        new_samples = new_entry.get("latencies_ms", [])
+        if not base_samples or not new_samples:
+            continue
+        base_median = statistics.median(base_samples)
+        new_median = statistics.median(new_samples)
+        change_pct = (new_median - base_median) / base_median * 100 if base_median else 0.0
+        p_value = mann_whitney_greater(new_samples, base_samples)
+        rows.append({
+            "query_id": query_id,
+            "type": new_entry.get("type"),
+            "query": new_entry.get("query"),
+            "base_median_ms": round(base_median, 3),
+            "new_median_ms": round(new_median, 3),
+            "change_pct": round(change_pct, 2),
+            "p_value": round(p_value, 4),
+            "regression": change_pct > threshold_pct and p_value < alpha,
+        })
+    return rows
+
+def compare_results(base, new, min_recall):
+    """Per-query result drift: recall of baseline names and Jaccard overlap"""
+    rows = []
+    for query_id, base_names in base.get("results", {}).items():
+        new_names = new.get("results", {}).get(query_id, [])
+        base_set, new_set = set(base_names), set(new_names)
+        recall = len(base_set & new_set) / len(base_set) if base_set else 1.0
+        union = base_set | new_set
+        jaccard = len(base_set & new_set) / len(union) if union else 1.0
+        rows.append({
+            "query_id": query_id,
+            "base_count": len(base_set),
+            "new_count": len(new_set),
+            "recall": round(recall, 4),
+            "jaccard": round(jaccard, 4),
+            "missing": sorted(base_set - new_set)[:10],
+            "drift": recall < min_recall,
+        })
+    return rows
+
+def latest_run(runs_dir=RUNS_DIR):
+    runs = sorted(glob.glob(os.path.join(runs_dir, "run-*.json")))
+    if not runs:
+        raise FileNotFoundError(f"No benchmark runs found in {runs_dir}")
+    return runs[-1]
+
+def load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def print_report(latency_rows, result_rows):
+    print(f"{'query':<7}{'type':<11}{'base ms':>10}{'new ms':>10}{'change':>9}{'p':>8}  status")
+    for r in latency_rows:
+        status = "REGRESSION" if r["regression"] else "ok"
+        print(f"{r['query_id']:<7}{r['type'] or '':<11}{r['base_median_ms']:>10.2f}{r['new_median_ms']:>10.2f}"
+              f"{r['change_pct']:>8.1f}%{r['p_value']:>8.3f}  {status}")
+    print()
+    print(f"{'query':<7}{'base':>6}{'new':>6}{'recall':>8}{'jaccard':>9}  status")
+    for r in result_rows:
+        status = "DRIFT" if r["drift"] else "ok"
+        print(f"{r['query_id']:<7}{r['base_count']:>6}{r['new_count']:>6}{r['recall']:>8.2f}{r['jaccard']:>9.2f}  {status}")
+        if r["drift"] and r["missing"]:
+            print(f"       missing: {', '.join(r['missing'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a benchmark run against the pinned baseline")
+    parser.add_argument("--run", default=None, help=f"Run file to check (default: newest in {RUNS_DIR}/)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Pinned baseline run")
+    parser.add_argument("--pin", action="store_true", help="Pin the run as the new baseline and exit")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed median slowdown in percent")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level for latency regressions")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="Minimum recall of baseline result names")
+    parser.add_argument("--output", default=None, help="Write the comparison report as JSON")
+    args = parser.parse_args()
+
+    run_file = args.run or latest_run()
+
+    if args.pin:
+        shutil.copyfile(run_file, args.baseline)
+        print(f"Pinned {run_file} as baseline {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Baseline not found: {args.baseline} (pin one with --pin)")
+        return 2
+
+    base, new = load_json(args.baseline), load_json(run_file)
+    print(f"Baseline: {args.baseline} ({base.get('timestamp', 'unknown')})")
+    print(f"Run:      {run_file} ({new.get('timestamp', 'unknown')})\n")
+
+    latency_rows = compare_latency(base, new, args.threshold, args.alpha)
+    result_rows = compare_results(base, new, args.min_recall)
+    print_report(latency_rows, result_rows)
+
+    regressions = sum(r["regression"] for r in latency_rows)
+    drifts = sum(r["drift"] for r in result_rows)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"baseline": args.baseline, "run": run_file, "latency": latency_rows,
+                       "results": result_rows, "regressions": regressions, "drifts": drifts}, f, indent=2)
+
+    print(f"\n{regressions} latency regression(s), {drifts} result drift(s)")
+    return 1 if regressions or drifts else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import argparse
+import heapq
+import statistics
+import sys
+import time
+from collections import Counter
+
+import psycopg2
+from dotenv import load_dotenv
+
+import rerank
+from app import FUZZY_THRESHOLD, _fuzzy_query, escape_like
+from db import db_settings
+from memory_index import MemoryIndex, word_similarity, word_trigrams
+
+load_dotenv()
+
+# (misspelled query, word the intended medicine's name contains)
+TYPO_CASES = [
+    ("paracetmol", "paracetamol"),
+    ("aspirn", "aspirin"),
+    ("ibuprofn", "ibuprofen"),
+    ("azithromycn", "azithromycin"),
+    ("amoxicilin", "amoxicillin"),
+    ("cetrizine", "cetirizine"),
+    ("metformn", "metformin"),
+    ("pantoprazol", "pantoprazole"),
+    ("avastn", "avastin"),
+    ("omeprazol", "omeprazole"),
+    ("atorvastatn", "atorvastatin"),
+    ("levocetrizine", "levocetirizine"),
+]
+
+def calculate_similarity(s1, s2):
+    """Simple similarity calculation without pg_trgm extension"""
+    s1, s2 = s1.lower(), s2.lower()
+    if s1 == s2:
+        return 1.0
+
+    # Levenshtein distance approximation
+    len1, len2 = len(s1), len(s2)
+    if len1 == 0: return 0.0
+    if len2 == 0: return 0.0
+
+    # Simple character overlap
+    common_chars = set(s1) & set(s2)
+    max_len = max(len1, len2)
+    overlap_score = len(common_chars) / max_len
+
+    # Length difference penalty
+    length_diff = abs(len1 - len2) / max_len
+    length_score = 1 - length_diff
+
+    # Substring bonus
+    substring_bonus = 0
+    if s1 in s2 or s2 in s1:
+        substring_bonus = 0.3
+
+    return min(1.0, overlap_score * 0.6 + length_score * 0.4 + substring_bonus)
+
+def legacy_fuzzy_query(cursor, q):
+    """The previous fuzzy search: 200 LIKE candidates re-scored in Python"""
+    cursor.execute("""
+        SELECT name FROM medicines
+        WHERE LOWER(name) LIKE '%%' || LOWER(%s) || '%%'
+           OR LOWER(name) LIKE '%%' || LOWER(%s) || '%%'
+        LIMIT 200
+    """, (escape_like(q), escape_like(q[:3])))
+    scored = [(calculate_similarity(q, name), name) for (name,) in cursor.fetchall()]
+    scored = [item for item in scored if item[0] > 0.1]
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [name for _, name in scored[:100]]
+
+def trigram_fuzzy_query(cursor, q):
+    results, _ = _fuzzy_query(cursor, q, FUZZY_THRESHOLD, 100, None)
+    return [r["name"] for r in results]
+
+def measure(cursor, search, q, iterations):
+    timings = []
+    names = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        names = search(cursor, q)
+        timings.append((time.perf_counter() - start) * 1000)
+    return names, timings
+
+# Candidate batch sizes for the re-ranking comparison
+RERANK_SIZES = (200, 2000, 20000)
+
+def rerank_candidates(index, query, size):
+    """``size`` rows to re-score, those sharing the most query trigrams first, repeated if the catalog is smaller"""
+    hits = Counter()
+    for gram in query:
+        hits.update(index.fuzzy_postings.get(gram))
+    rows = [i for i, _ in hits.most_common()] + [i for i in range(index.size) if i not in hits]
+    return [rows[k % len(rows)] for k in range(size)]
+
+def legacy_rerank(index, q, query, rows, k):
+    """calculate_similarity() per candidate, the scorer fuzzy search used before pg_trgm"""
+    scored = [(calculate_similarity(q, index.name_lower[i]), i) for i in rows]
+    return [i for _, i in heapq.nlargest(k, scored)]
+
+def python_rerank(index, q, query, rows, k):
+    """The memory backend's pure-Python scorer: word_similarity() per candidate"""
+    scored = [(1.0 - word_similarity(query, word_trigrams(index.name_lower[i])), index.name_rank[i], i)
+              for i in rows]
+    return [i for _, _, i in heapq.nsmallest(k, scored)]
+
+def numpy_rerank(index, q, query, rows, k):
+    """rerank.py: the whole batch as one padded trigram matrix, top k by argpartition"""
+    query_ids = [pos for pos in map(index.fuzzy_postings.position, query) if pos is not None]
+    rows = rerank.np.asarray(rows)
+    matrix, lengths = rerank.pad_sequences(rerank.u32(index.fuzzy_sequence),
+                                           rerank.u32(index.fuzzy_sequence_offsets), rows)
+    similarity = rerank.word_similarity_batch(matrix, lengths, query_ids, len(query))
+    picked = rerank.top_k(1.0 - similarity, rerank.u32(index.name_rank)[rows], k)
+    return rows[picked].tolist()
+
+def run_rerank(iterations=5, top_k=10):
+    """Per-request CPU time of each fuzzy re-ranking scorer at growing candidate counts; no database needed"""
+    if not rerank.available():
+        print("numpy is not installed, nothing to compare")
+        return 1
+    index = MemoryIndex.from_json()
+    scorers = [("legacy", legacy_rerank), ("python", python_rerank), ("numpy", numpy_rerank)]
+    print(f"{index.size} medicines, {len(TYPO_CASES)} typo queries, {iterations} iterations, top {top_k}")
+    print(f"{'candidates':>10}" + "".join(f"{label + ' cpu ms':>16}" for label, _ in scorers)
+          + f"{'numpy speedup':>16}{'same top k':>12}")
+    for size in RERANK_SIZES:
+        timings = {label: [] for label, _ in scorers}
+        agreed = 0
+        for q, _ in TYPO_CASES:
+            query = set(word_trigrams(q))
+            rows = rerank_candidates(index, query, size)
+            results = {}
+            for label, scorer in scorers:
+                for _ in range(iterations):
+                    start = time.process_time()
+                    results[label] = scorer(index, q, query, rows, top_k)
+                    timings[label].append((time.process_time() - start) * 1000)
+            agreed += results["python"] == results["numpy"]
+        medians = {label: statistics.median(values) for label, values in timings.items()}
+        print(f"{size:>10}" + "".join(f"{medians[label]:>16.2f}" for label, _ in scorers)
+              + f"{medians['python'] / max(medians['numpy'], 1e-6):>15.1f}x{agreed:>9}/{len(TYPO_CASES)}")
+    return 0
+
+def main(iterations=20, top_k=10):
+    conn = psycopg2.connect(**db_settings())
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    implementations = [("legacy", legacy_fuzzy_query), ("trigram", trigram_fuzzy_query)]
+    summary = {label: {"hits": 0, "timings": []} for label, _ in implementations}
+
+    print(f"{'query':<16}" + "".join(f"{label + ' hit':>14}{label + ' p50 ms':>16}" for label, _ in implementations))
+    for q, expected in TYPO_CASES:
+        line = f"{q:<16}"
+        for label, search in implementations:
+            names, timings = measure(cursor, search, q, iterations)
+            hit = any(expected in name.lower() for name in names[:top_k])
+            summary[label]["hits"] += hit
+            summary[label]["timings"].extend(timings)
+            line += f"{'yes' if hit else 'no':>14}{statistics.median(timings):>16.2f}"
+        print(line)
+
+    print()
+    for label, data in summary.items():
+        timings = sorted(data["timings"])
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{label:<8} recall@{top_k}: {data['hits']}/{len(TYPO_CASES)}  "
+              f"p50: {statistics.median(timings):.2f} ms  p95: {p95:.2f} ms")
+
+    cursor.close()
+    conn.close()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fuzzy search implementations")
+    parser.add_argument("mode", nargs="?", default="search", choices=["search", "rerank"],
+                        help="search: legacy vs trigram queries against Postgres; "
+                             "rerank: CPU time of the candidate scorers at 200, 2k and 20k candidates")
+    args = parser.parse_args()
+    sys.exit(run_rerank() if args.mode == "rerank" else main())
@@ -0,0 +1,68 @@
+import json
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+from app import row_to_medicine
+
+SAMPLE_FILE = Path("DB_Dataset/DB_Dataset/data/h.json")
+
+def load_rows(count=100):
+    """Sample rows shaped like the search queries return them (price as Decimal before, float now)"""
+    with open(SAMPLE_FILE, 'r', encoding='utf-8') as f:
+        medicines = json.load(f)[:count]
+    legacy = []
+    lean = []
+    for m in medicines:
+        values = (m.get('name'), m.get('manufacturer_name'), m.get('type'), m.get('price'),
+                  m.get('pack_size_label'), m.get('short_composition'))
+        legacy.append(values[:3] + (Decimal(str(values[3] or 0)).quantize(Decimal("0.01")),) + values[4:])
+        lean.append(values[:3] + (float(values[3] or 0),) + values[4:])
+    return legacy, lean
+
+def legacy_response(rows):
+    """Positional dicts, jsonable_encoder and json.dumps, as the handlers did before"""
+    results = []
+    for row in rows:
+        results.append({
+            "name": row[0],
+            "manufacturer_name": row[1],
+            "type": row[2],
+            "price": row[3],
+            "pack_size_label": row[4],
+            "short_composition": row[5]
+        })
+    payload = {"query": "q", "type": "prefix", "results": results, "count": len(results),
+               "execution_time_ms": 1.0}
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+def lean_response(rows):
+    """zip-built dicts serialized straight to bytes with orjson"""
+    results = [row_to_medicine(row) for row in rows]
+    payload = {"query": "q", "type": "prefix", "results": results, "count": len(results),
+               "next_cursor": None, "execution_time_ms": 1.0}
+    return orjson.dumps(payload)
+
+def per_request_us(build, rows, iterations):
+    build(rows)  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build(rows)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main(iterations=2000):
+    print(f"{'rows':>6}{'legacy us':>14}{'lean us':>12}{'speedup':>10}")
+    for count in (10, 100, 500):
+        legacy_rows, lean_rows = load_rows(count)
+        legacy = per_request_us(legacy_response, legacy_rows, iterations)
+        lean = per_request_us(lean_response, lean_rows, iterations)
+        print(f"{count:>6}{legacy:>14.1f}{lean:>12.1f}{legacy / lean:>9.1f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import orjson
+
+
+class LRUCache:
+    """Thread-safe in-process cache with a size bound (LRU eviction) and a per-entry TTL"""
+
+    def __init__(self, max_entries=10000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class RedisCache:
+    """Cache backed by a Redis-compatible server so every worker shares one result set.
+
+    Eviction is left to the server's maxmemory policy; entries expire after ``ttl``.
+    Values are stored as JSON, never pickled: whatever the server returns is only parsed,
+    so a client that can write to it can't run code in the API workers. Tuples come back
+    as lists, which the callers only unpack.
+    """
+
+    def __init__(self, url, ttl=300.0, prefix="medsearch:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package") from e
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        if raw is None:
+            return None
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # Not written by us (or by an older pickling version): treat it as a miss
+            return None
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, orjson.dumps(value), px=int(self.ttl * 1000))
+
+    def clear(self):
+        # Keys carry the data version, so stale entries are simply never read again
+        pass
+
+    def stats(self):
+        info = self._client.info("stats")
+        return {
+            "backend": "redis",
+            "ttl_s": self.ttl,
+            "evictions": info.get("evicted_keys", 0),
+            "expirations": info.get("expired_keys", 0),
+        }
+
+
+class ResultCache:
+    """Search result cache keyed on (data version, search type, normalized query, params)"""
+
+    def __init__(self, backend, enabled=True):
+        self.backend = backend
+        self.enabled = enabled
+        self.data_version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        ttl = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+        if os.getenv("CACHE_BACKEND", "memory") == "redis":
+            backend = RedisCache(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0"), ttl=ttl)
+        else:
+            backend = LRUCache(max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "10000")), ttl=ttl)
+        return cls(backend, enabled=os.getenv("CACHE_ENABLED", "1") == "1")
+
+    def key(self, search_type, q, **params):
+        # A JSON array, so no query or filter value can spell out another parameter set's key
+        return orjson.dumps([self.data_version, search_type, q.lower(), sorted(params.items())]).decode()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.enabled:
+            self.backend.set(key, value)
+
+    def set_data_version(self, version):
+        """Switch to a new data version; returns True if it changed"""
+        if version == self.data_version:
+            return False
+        self.data_version = version
+        self.backend.clear()
+        return True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "data_version": self.data_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            **self.backend.stats(),
+        }
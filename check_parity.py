@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+import psycopg2
+from dotenv import load_dotenv
+
+from app import (FULLTEXT_SQL, FUZZY_SETUP, FUZZY_SQL, MAX_LIMIT, PREFIX_SQL, SUBSTRING_SQL, fulltext_params,
+                 fuzzy_params, prefix_params, substring_params)
+from db import db_settings
+from memory_index import DATA_DIR, MemoryIndex
+
+load_dotenv()
+
+# search type -> (sql, params builder, setup, MemoryIndex method, minimum overlap to pass)
+# Prefix and substring are exact matches and must agree row for row; the memory backend's
+# full-text stemming/ranking and fuzzy extent search approximate Postgres, so they get slack.
+# Substring pages are ordered by name: set MEMORY_COLLATION to the database's collation.
+SEARCHES = {
+    "prefix": (PREFIX_SQL, prefix_params, None, "prefix", 1.0),
+    "substring": (SUBSTRING_SQL, substring_params, None, "substring", 1.0),
+    "fulltext": (FULLTEXT_SQL, fulltext_params, None, "fulltext", 0.8),
+    "fuzzy": (FUZZY_SQL, fuzzy_params, FUZZY_SETUP, "fuzzy", 0.8),
+}
+
+def medicine_keys(rows):
+    # Ids differ after incremental imports, so rows are compared on their content
+    return [(row[0], row[1], row[4]) for row in rows]
+
+def overlap(expected, actual):
+    if not expected and not actual:
+        return 1.0
+    shared = sum((Counter(expected) & Counter(actual)).values())
+    return shared / max(len(expected), len(actual))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory search backend with Postgres")
+    parser.add_argument("--queries", default="benchmark_queries.json")
+    parser.add_argument("--limit", type=int, default=MAX_LIMIT)
+    parser.add_argument("--data-dir", default=os.getenv("MEMORY_DATA_DIR", str(DATA_DIR)))
+    args = parser.parse_args()
+
+    with open(args.queries, "r") as f:
+        queries = json.load(f)["queries"]
+    index = MemoryIndex.from_json(args.data_dir, os.getenv("MEMORY_COLLATION") or None)
+    conn = psycopg2.connect(**db_settings())
+    cursor = conn.cursor()
+    failures = 0
+
+    for query_id, spec in queries.items():
+        sql, build_params, setup, method, required = SEARCHES[spec["type"]]
+        params = build_params(spec["query"], args.limit)
+        cursor.execute(setup + sql if setup else sql, params)
+        expected = medicine_keys(cursor.fetchall()[:args.limit])
+        actual = medicine_keys(getattr(index, method)(params)[:args.limit])
+        score = overlap(expected, actual)
+        same_order = expected == actual
+        failed = score < required
+        failures += failed
+        print(f"{'FAIL' if failed else 'PASS'}  {query_id:>3} {spec['type']:<9} {spec['query']!r:<18} "
+              f"postgres {len(expected):4}  memory {len(actual):4}  overlap {score:6.1%}"
+              f"{'  same order' if same_order else ''}")
+
+    cursor.close()
+    conn.close()
+    print(f"\n{len(queries) - failures}/{len(queries)} queries within tolerance")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import json
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+from app import (FULLTEXT_SQL, FUZZY_SQL, INGREDIENT_SQL, PREFIX_SQL, fulltext_params, fuzzy_params,
+                 ingredient_params, prefix_bounds, prefix_params)
+from db import db_settings
+from facets import NO_FILTERS
+from slow_queries import walk_plan
+from suggest import Suggester
+
+load_dotenv()
+
+# (label, sql, params, index the plan must use)
+PLAN_CHECKS = [
+    ("prefix 'para'", PREFIX_SQL, prefix_params("para"), "idx_name_prefix"),
+    ("prefix 'Avastin'", PREFIX_SQL, prefix_params("Avastin"), "idx_name_prefix"),
+    ("prefix '50%_off'", PREFIX_SQL, prefix_params("50%_off"), "idx_name_prefix"),
+    ("prefix 'para' page 5", PREFIX_SQL, prefix_params("para", after=("paracetamol 500mg tablet", 0)),
+     "idx_name_prefix"),
+    ("prefix 'para' active only", PREFIX_SQL,
+     prefix_params("para", filters={**NO_FILTERS, "f_exclude_discontinued": True}), "idx_name_prefix_active"),
+    ("suggest 'pa'", Suggester.SQL, dict(zip(("low", "high"), prefix_bounds("pa")), limit=2001),
+     "idx_name_suggestions"),
+    ("fulltext 'antibiotic'", FULLTEXT_SQL, fulltext_params("antibiotic"), "idx_search_fts"),
+    ("fulltext 'blood pressure'", FULLTEXT_SQL, fulltext_params("blood pressure"), "idx_search_fts"),
+    ("fulltext 'paracetamol -syrup'", FULLTEXT_SQL, fulltext_params("paracetamol -syrup"), "idx_search_fts"),
+    ("fuzzy 'paracetmol'", FUZZY_SQL, fuzzy_params("paracetmol"), "idx_name_trgm_gist"),
+    ("fuzzy 'aspirn'", FUZZY_SQL, fuzzy_params("aspirn"), "idx_name_trgm_gist"),
+    ("ingredient 'paracetamol'", INGREDIENT_SQL, ingredient_params(["paracetamol"]),
+     "idx_medicine_ingredients_ingredient"),
+    ("ingredient 'paracetamol + caffeine'", INGREDIENT_SQL, ingredient_params(["paracetamol", "caffeine"]),
+     "idx_medicine_ingredients_ingredient"),
+]
+
+INDEX_NODE_TYPES = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+def explain(cursor, sql, params):
+    """Run EXPLAIN (ANALYZE, FORMAT JSON) and return the plan root plus execution time"""
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    document = cursor.fetchone()[0]
+    if isinstance(document, str):
+        document = json.loads(document)
+    return document[0]["Plan"], document[0]["Execution Time"]
+
+def check_plan(plan, expected_index):
+    """Return a list of problems with the plan; empty means it used the expected index"""
+    nodes = list(walk_plan(plan))
+    problems = []
+    if not any(n["Node Type"] in INDEX_NODE_TYPES and n.get("Index Name") == expected_index for n in nodes):
+        problems.append(f"expected an index scan on {expected_index}")
+    seq_scans = [n for n in nodes if n["Node Type"] == "Seq Scan" and n.get("Relation Name") == "medicines"]
+    if seq_scans:
+        problems.append("sequential scan on medicines")
+    return problems
+
+def main():
+    conn = psycopg2.connect(**db_settings())
+    cursor = conn.cursor()
+    failures = 0
+
+    for label, sql, params, expected_index in PLAN_CHECKS:
+        plan, execution_ms = explain(cursor, sql, params)
+        problems = check_plan(plan, expected_index)
+        status = "PASS" if not problems else "FAIL"
+        print(f"{status}  {label:<30} {execution_ms:8.3f} ms  {plan['Node Type']}")
+        for problem in problems:
+            print(f"      - {problem}")
+        failures += bool(problems)
+
+    cursor.close()
+    conn.close()
+    print(f"\n{len(PLAN_CHECKS) - failures}/{len(PLAN_CHECKS)} plan checks passed")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
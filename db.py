@@ -0,0 +1,194 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from psycopg2 import pool as pg_pool
+
+from metrics import add_stage
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within the acquire timeout"""
+
+
+def db_settings():
+    """Connection parameters read from the DB_* environment variables"""
+    return {
+        "dbname": os.getenv("DB_NAME", "medicine_search"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", "password"),
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5433"),
+    }
+
+
+class DatabasePool:
+    """Bounded psycopg2 connection pool with a matching thread pool for query offload.
+
+    Queries run on worker threads so the event loop never blocks on the socket,
+    and at most ``max_size`` of them hold a connection at any time.
+    """
+
+    def __init__(self, min_size=2, max_size=10, acquire_timeout=5.0, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.connect_kwargs = connect_kwargs
+        self._pool = None
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._queued = 0
+        self._acquired_total = 0
+        self._timeouts_total = 0
+        self._acquire_seconds_total = 0.0
+        self._acquire_seconds_max = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", "5.0")),
+            **db_settings(),
+        )
+
+    @property
+    def is_open(self):
+        return self._pool is not None
+
+    def open(self):
+        if self._pool is not None:
+            return
+        self._pool = pg_pool.ThreadedConnectionPool(self.min_size, self.max_size, **self.connect_kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_size, thread_name_prefix="db-pool")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    @contextmanager
+    def connection(self, timeout=None, started_at=None):
+        """Check out a connection, waiting at most ``timeout`` seconds for a free slot"""
+        if self._pool is None:
+            raise RuntimeError("Database pool is not open")
+        if timeout is None:
+            timeout = self.acquire_timeout
+
+        start = started_at if started_at is not None else time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=max(timeout, 0))
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._timeouts_total += 1
+        if not acquired:
+            raise PoolTimeoutError(f"No database connection available within {self.acquire_timeout}s")
+
+        try:
+            conn = self._pool.getconn()
+            conn.autocommit = True
+        except Exception:
+            self._slots.release()
+            raise
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._acquired_total += 1
+            self._acquire_seconds_total += elapsed
+            self._acquire_seconds_max = max(self._acquire_seconds_max, elapsed)
+        add_stage("acquire", elapsed)
+
+        try:
+            yield conn
+        finally:
+            self._pool.putconn(conn, close=bool(conn.closed))
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def _execute(self, submitted_at, fn, args):
+        with self._lock:
+            self._queued -= 1
+        # Time spent queued for a worker thread counts against the acquire timeout
+        remaining = self.acquire_timeout - (time.perf_counter() - submitted_at)
+        with self.connection(timeout=remaining, started_at=submitted_at) as conn:
+            with conn.cursor() as cursor:
+                return fn(cursor, *args)
+
+    def _cancelled_while_queued(self, future):
+        # A call abandoned before a worker picked it up (e.g. a deadline) never reaches _execute
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn, *args):
+        """Run ``fn(cursor, *args)`` on a pooled connection without blocking the event loop"""
+        if self._executor is None:
+            raise RuntimeError("Database pool is not open")
+        with self._lock:
+            self._queued += 1
+        # Carry the caller's context (request timer) onto the worker thread
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._execute, time.perf_counter(), fn, args)
+        future.add_done_callback(self._cancelled_while_queued)
+        return await asyncio.wrap_future(future)
+
+    async def run_with_deadline(self, deadline, fn, *args):
+        """Like run(), but give up after ``deadline`` seconds and cancel the query server-side.
+
+        Raises asyncio.TimeoutError. A call still waiting for a connection at the deadline
+        never starts its query, so an abandoned branch doesn't keep holding a pooled slot.
+        """
+        lock = threading.Lock()
+        state = {"conn": None, "expired": False}
+
+        def tracked(cursor, *fn_args):
+            with lock:
+                if state["expired"]:
+                    raise asyncio.TimeoutError()
+                state["conn"] = cursor.connection
+            try:
+                return fn(cursor, *fn_args)
+            finally:
+                # Cleared before the connection goes back to the pool, so a late cancel can't hit another query
+                with lock:
+                    state["conn"] = None
+
+        try:
+            return await asyncio.wait_for(self.run(tracked, *args), deadline)
+        except asyncio.TimeoutError:
+            with lock:
+                state["expired"] = True
+                if state["conn"] is not None:
+                    state["conn"].cancel()
+            raise
+
+    def stats(self):
+        with self._lock:
+            acquired = self._acquired_total
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "acquire_timeout_s": self.acquire_timeout,
+                "in_use": self._in_use,
+                "waiting": self._waiting + self._queued,
+                "acquired_total": acquired,
+                "timeouts_total": self._timeouts_total,
+                "acquire_ms_avg": round(self._acquire_seconds_total / acquired * 1000, 3) if acquired else 0.0,
+                "acquire_ms_max": round(self._acquire_seconds_max * 1000, 3),
+            }
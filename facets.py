@@ -0,0 +1,97 @@
+from fastapi import Query
+
+# Optional filters appended to every search query's WHERE clause. psycopg2 inlines the values, so an
+# unset filter folds to TRUE at plan time and a set one reaches the planner as a plain predicate that
+# idx_type_price, idx_manufacturer_prefix or the partial idx_name_prefix_active can serve.
+FILTER_SQL = """
+      AND (%(f_type)s::text IS NULL OR type = %(f_type)s)
+      AND (%(f_manufacturer)s::text IS NULL OR manufacturer_name = %(f_manufacturer)s)
+      AND (%(f_min_price)s::numeric IS NULL OR price >= %(f_min_price)s)
+      AND (%(f_max_price)s::numeric IS NULL OR price <= %(f_max_price)s)
+      AND (NOT %(f_exclude_discontinued)s OR NOT is_discontinued)"""
+
+NO_FILTERS = {
+    "f_type": None,
+    "f_manufacturer": None,
+    "f_min_price": None,
+    "f_max_price": None,
+    "f_exclude_discontinued": False,
+}
+
+# Upper edges of the price facet buckets; the last bucket is open-ended
+PRICE_EDGES = (50, 100, 250, 500, 1000)
+
+# Manufacturers listed in the facet, most frequent first
+MANUFACTURER_FACET_SIZE = 20
+
+
+def filter_params(
+    medicine_type: str = Query(None, alias="type", max_length=100),
+    manufacturer: str = Query(None, max_length=500),
+    min_price: float = Query(None, ge=0),
+    max_price: float = Query(None, ge=0),
+    exclude_discontinued: bool = Query(False)
+):
+    """Filter query parameters shared by the search endpoints, as FILTER_SQL parameters"""
+    return {
+        "f_type": medicine_type,
+        "f_manufacturer": manufacturer,
+        "f_min_price": min_price,
+        "f_max_price": max_price,
+        "f_exclude_discontinued": exclude_discontinued,
+    }
+
+
+def with_filters(params, filters):
+    params.update(NO_FILTERS if filters is None else filters)
+    return params
+
+
+def has_filters(filters):
+    return filters is not None and filters != NO_FILTERS
+
+
+def facets_sql(match):
+    """Facet counts over every medicine matching the `match` predicate and the active filters"""
+    return f"""
+        WITH matches AS (
+            SELECT type, manufacturer_name, price, is_discontinued
+            FROM medicines
+            WHERE {match}{FILTER_SQL}
+        )
+        SELECT 'type', type, count(*) FROM matches GROUP BY type
+        UNION ALL
+        (SELECT 'manufacturer', manufacturer_name, count(*) FROM matches
+         GROUP BY manufacturer_name ORDER BY count(*) DESC, manufacturer_name LIMIT %(facet_size)s)
+        UNION ALL
+        SELECT 'price', width_bucket(price, %(price_edges)s::numeric[])::text, count(*) FROM matches GROUP BY 2
+        UNION ALL
+        SELECT 'discontinued', is_discontinued::text, count(*) FROM matches GROUP BY is_discontinued
+    """
+
+
+def facet_params(params):
+    params.update({"facet_size": MANUFACTURER_FACET_SIZE, "price_edges": list(PRICE_EDGES)})
+    return params
+
+
+def shape_facets(rows):
+    """(facet, value, count) rows -> the "facets" object of a search response"""
+    facets = {"total": 0, "type": [], "manufacturer": [], "price": [], "discontinued": []}
+    for facet, value, count in rows:
+        if facet == "price":
+            bucket = int(value) if value is not None else None
+            if bucket is None:
+                facets["price"].append({"min": None, "max": None, "count": count})
+                continue
+            low = PRICE_EDGES[bucket - 1] if bucket > 0 else 0
+            high = PRICE_EDGES[bucket] if bucket < len(PRICE_EDGES) else None
+            facets["price"].append({"min": low, "max": high, "count": count})
+        elif facet == "discontinued":
+            facets["discontinued"].append({"value": value == "true" if value is not None else None, "count": count})
+            facets["total"] += count
+        else:
+            facets[facet].append({"value": value, "count": count})
+    facets["price"].sort(key=lambda bucket: (bucket["min"] is None, bucket["min"] or 0))
+    facets["type"].sort(key=lambda entry: -entry["count"])
+    return facets
@@ -0,0 +1,23 @@
+def reciprocal_rank_fusion(ranked_lists, weights=None, k=60):
+    """Merge ranked result lists with weighted reciprocal-rank fusion.
+
+    ``ranked_lists`` maps a strategy name to a list of (key, result) pairs, best first.
+    Each result scores sum(weight / (k + rank)) over the lists it appears in, so agreement
+    between strategies outweighs a single high placement. Results are deduplicated by key;
+    the first strategy to return a key supplies the result dict and later ones add their
+    score fields to it. Returns [score, strategies, result] entries, best first.
+    """
+    fused = {}
+    for strategy, ranked in ranked_lists.items():
+        weight = 1.0 if weights is None else weights.get(strategy, 1.0)
+        for rank, (key, result) in enumerate(ranked, start=1):
+            entry = fused.get(key)
+            if entry is None:
+                fused[key] = entry = [0.0, [], dict(result)]
+            else:
+                for field, value in result.items():
+                    entry[2].setdefault(field, value)
+            entry[0] += weight / (k + rank)
+            entry[1].append(strategy)
+    # Ties fall back to name so the order is stable between identical requests
+    return sorted(fused.values(), key=lambda entry: (-entry[0], entry[2].get("name") or ""))
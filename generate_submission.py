@@ -15,45 +15,51 @@ def run_benchmark_simple():
     print("Running benchmarks for submission.json...")
     print("=" * 50)
     
-    for query_id, query_info in benchmark_data['queries'].items():
-        query_text = query_info['query']
-        query_type = query_info['type']
+    # All queries go in one batch request; answers stream back as NDJSON lines in the same order
+    query_ids = list(benchmark_data['queries'])
+    items = [
+        {'type': benchmark_data['queries'][query_id]['type'],
+         'query': benchmark_data['queries'][query_id]['query'],
+         'limit': 500}
+        for query_id in query_ids
+    ]
+    
+    try:
+        response = requests.post(f"{base_url}/search/batch", json={'items': items}, stream=True)
+        response.raise_for_status()
+        answers = [json.loads(line) for line in response.iter_lines() if line]
+    except Exception as e:
+        print(f"❌ Batch request failed: {str(e)}")
+        answers = []
+    
+    answers_by_index = {answer['index']: answer for answer in answers}
+    for index, query_id in enumerate(query_ids):
+        item = items[index]
+        print(f"Query {query_id}: {item['type']} search for '{item['query']}'")
+        answer = answers_by_index.get(index)
+        
+        if answer is None or 'error' in answer:
+            print(f"  ❌ Error: {answer['error'] if answer else 'no answer'}")
+            results[query_id] = []
+            print()
+            continue
         
-        print(f"Query {query_id}: {query_type} search for '{query_text}'")
+        medicine_names = []
         
-        # Construct API endpoint
-        endpoint = f"{base_url}/search/{query_type}"
-        params = {'q': query_text, 'limit': 500}
+        # Extract just the medicine names
+        for result in answer.get('results', []):
+            name = result.get('name', '').strip()
+            if name and name not in medicine_names:  # Avoid duplicates
+                medicine_names.append(name)
         
-        try:
-            response = requests.get(endpoint, params=params)
-            
-            if response.status_code == 200:
-                data = response.json()
-                medicine_names = []
-                
-                # Extract just the medicine names
-                for result in data.get('results', []):
-                    name = result.get('name', '').strip()
-                    if name and name not in medicine_names:  # Avoid duplicates
-                        medicine_names.append(name)
-                
-                results[query_id] = medicine_names
-                print(f"  ✅ Found {len(medicine_names)} unique medicines")
-                
-                # Show first few results
-                for i, name in enumerate(medicine_names[:5]):
-                    print(f"    {i+1}. {name}")
-                if len(medicine_names) > 5:
-                    print(f"    ... and {len(medicine_names) - 5} more")
-                    
-            else:
-                print(f"  ❌ Error: HTTP {response.status_code}")
-                results[query_id] = []
-                
-        except Exception as e:
-            print(f"  ❌ Exception: {str(e)}")
-            results[query_id] = []
+        results[query_id] = medicine_names
+        print(f"  ✅ Found {len(medicine_names)} unique medicines")
+        
+        # Show first few results
+        for i, name in enumerate(medicine_names[:5]):
+            print(f"    {i+1}. {name}")
+        if len(medicine_names) > 5:
+            print(f"    ... and {len(medicine_names) - 5} more")
         
         print()
     
@@ -1,133 +1,441 @@
+import argparse
 import json
-import psycopg2
-from psycopg2.extras import execute_values
 import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import psycopg2
+from dotenv import load_dotenv
+
+from db import db_settings
+from ingredients import parse_composition
+
+load_dotenv()
+
+DATA_DIR = Path("DB_Dataset/DB_Dataset/data")
+STAGING_TABLE = "medicines_staging"
+COLUMNS = ("sku_id", "name", "manufacturer_name", "marketer_name", "type", "price",
+           "pack_size_label", "short_composition", "is_discontinued", "available")
+
 def get_db_connection():
-    return psycopg2.connect(
-        dbname="medicine_search",
-        user="postgres",
-        password="syed",  # Your password from .env
-        host="localhost",
-        port="5433"
+    return psycopg2.connect(**db_settings())
+
+def iter_json_records(path, chunk_size=1 << 20):
+    """Yield medicine objects from a JSON file without reading the whole array into memory"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        stripped = buffer.lstrip()
+        if not stripped:
+            return
+
+        if stripped[0] != '[':
+            # Wrapped formats ({"medicines": [...]}, {"data": [...]} or a single object) are parsed whole
+            data = json.loads(buffer + f.read())
+            if isinstance(data, dict) and 'medicines' in data:
+                yield from data['medicines']
+            elif isinstance(data, dict) and 'data' in data:
+                yield from data['data']
+            else:
+                yield data
+            return
+
+        pos = buffer.index('[') + 1
+        while True:
+            # Skip separators, refilling the buffer when it runs out
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer):
+                    break
+                buffer, pos = f.read(chunk_size), 0
+                if not buffer:
+                    raise ValueError(f"Unterminated JSON array in {path}")
+            if buffer[pos] == ']':
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The object straddles the chunk boundary, read more and retry
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield record
+            pos = end
+
+def extract_medicine(medicine):
+    """Map a raw JSON record onto the medicines columns, or None if it has no name"""
+    name = medicine.get('name', '')
+    if not name:
+        return None
+    sku_id = medicine.get('sku_id', medicine.get('id', ''))
+    return (
+        str(sku_id) if sku_id is not None else '',
+        name,
+        medicine.get('manufacturer_name', medicine.get('manufacturer', '')),
+        medicine.get('marketer_name', medicine.get('marketer', '')),
+        medicine.get('type', medicine.get('category', 'unknown')),
+        float(medicine.get('price', 0.0)) if medicine.get('price') else 0.0,
+        medicine.get('pack_size_label', medicine.get('pack_size', '')),
+        medicine.get('short_composition', medicine.get('composition', '')),
+        bool(medicine.get('is_discontinued', False)),
+        bool(medicine.get('available', True)),
     )
 
-def load_json_files():
+def copy_escape(value):
+    """Encode one value in COPY text format"""
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+class CopyStream:
+    """File-like reader that feeds COPY FROM STDIN from a generator of lines"""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._pending = ""
+
+    def read(self, size=-1):
+        chunks = [self._pending]
+        length = len(self._pending)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            self._pending = ""
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+def staging_lines(file_order, path, counter):
+    for line_no, medicine in enumerate(iter_json_records(path)):
+        values = extract_medicine(medicine)
+        if values is None:
+            continue
+        if not values[0]:
+            values = (f"auto_{path.stem}_{line_no}",) + values[1:]
+        counter[0] += 1
+        yield "\t".join([str(file_order), str(line_no)] + [copy_escape(v) for v in values]) + "\n"
+
+def load_file(file_order, path):
+    """Worker: stream one JSON file into the staging table over its own connection"""
+    start = time.perf_counter()
+    counter = [0]
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {STAGING_TABLE} (file_order, line_no, {', '.join(COLUMNS)}) FROM STDIN",
+                CopyStream(staging_lines(file_order, path, counter)),
+            )
+        conn.commit()
+        return path.name, counter[0], time.perf_counter() - start, None
+    except Exception as e:
+        conn.rollback()
+        return path.name, 0, time.perf_counter() - start, str(e)
+    finally:
+        conn.close()
+
+def create_staging_table(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE};")
+    cursor.execute(f"""
+        CREATE UNLOGGED TABLE {STAGING_TABLE} (
+            file_order INTEGER NOT NULL,
+            line_no INTEGER NOT NULL,
+            sku_id VARCHAR(255),
+            name VARCHAR(500),
+            manufacturer_name VARCHAR(500),
+            marketer_name VARCHAR(500),
+            type VARCHAR(100),
+            price DECIMAL(10,2),
+            pack_size_label VARCHAR(255),
+            short_composition TEXT,
+            is_discontinued BOOLEAN,
+            available BOOLEAN
+        );
+    """)
+
+def drop_secondary_indexes(cursor, table="medicines"):
+    """Drop indexes that don't back a constraint and return their definitions for rebuilding"""
+    cursor.execute("""
+        SELECT i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.schemaname = current_schema() AND i.tablename = %s
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)
+    """, (table,))
+    indexes = cursor.fetchall()
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX "{name}";')
+    return indexes
+
+def rebuild_indexes(cursor, indexes):
+    for _, definition in indexes:
+        cursor.execute(definition + ";")
+
+def stage_files(files, workers):
+    """Load every file into the staging table in parallel; returns (rows staged, files failed)"""
+    staged = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(load_file, order, path) for order, path in enumerate(files)]
+        for future in futures:
+            name, rows, seconds, error = future.result()
+            if error:
+                print(f"  Error processing {name}: {error}")
+                failed += 1
+            else:
+                print(f"  {name}: {rows} records in {seconds:.2f}s")
+                staged += rows
+    return staged, failed
+
+def index_ingredients(cursor, medicine_ids=None):
+    """Parse short_composition into medicine_ingredients for the given medicines (all of them when None)"""
+    if medicine_ids is not None:
+        if not medicine_ids:
+            return 0
+        cursor.execute("DELETE FROM medicine_ingredients WHERE medicine_id = ANY(%s);", (medicine_ids,))
+
+    # Parsed rows are spooled to disk and COPYed back, so memory stays flat on a full reload
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        with cursor.connection.cursor(name="compositions") as reader:
+            reader.itersize = 10000
+            if medicine_ids is None:
+                reader.execute("SELECT id, short_composition FROM medicines;")
+            else:
+                reader.execute("SELECT id, short_composition FROM medicines WHERE id = ANY(%s);", (medicine_ids,))
+            for med_id, composition in reader:
+                for name, strength in parse_composition(composition):
+                    spool.write(f"{med_id}\t{copy_escape(name)}\t{copy_escape(strength)}\n")
+        spool.seek(0)
+        cursor.execute("""
+            CREATE TEMP TABLE parsed_ingredients (
+                medicine_id INTEGER NOT NULL,
+                name TEXT COLLATE "C" NOT NULL,
+                strength TEXT
+            ) ON COMMIT DROP;
+        """)
+        cursor.copy_expert("COPY parsed_ingredients FROM STDIN", spool)
+
+    cursor.execute("""
+        INSERT INTO ingredients (name)
+        SELECT DISTINCT name FROM parsed_ingredients
+        ON CONFLICT (name) DO NOTHING;
+    """)
+    cursor.execute("""
+        INSERT INTO medicine_ingredients (medicine_id, ingredient_id, strength)
+        SELECT p.medicine_id, i.id, p.strength
+        FROM parsed_ingredients p
+        JOIN ingredients i ON i.name = p.name;
+    """)
+    indexed = cursor.rowcount
+    cursor.execute("DROP TABLE parsed_ingredients;")
+    return indexed
+
+def apply_full(cursor):
+    """Replace the whole table from staging; fastest, but readers wait on the table lock until commit"""
+    print("Clearing existing data...")
+    cursor.execute("TRUNCATE TABLE medicines, medicine_ingredients, ingredients RESTART IDENTITY;")
+
+    print("Dropping secondary indexes...")
+    indexes = drop_secondary_indexes(cursor)
+
+    # Keep the first occurrence of each sku_id, inserted in file order
+    print("Inserting unique medicines...")
+    columns = ", ".join(COLUMNS)
+    cursor.execute(f"""
+        INSERT INTO medicines ({columns})
+        SELECT {columns}
+        FROM (
+            SELECT DISTINCT ON (sku_id) *
+            FROM {STAGING_TABLE}
+            ORDER BY sku_id, file_order, line_no
+        ) first_seen
+        ORDER BY file_order, line_no;
+    """)
+    inserted = cursor.rowcount
+
+    print(f"Rebuilding {len(indexes)} indexes...")
+    rebuild_indexes(cursor, indexes)
+
+    print("Indexing ingredients...")
+    print(f"  {index_ingredients(cursor)} medicine ingredients")
+    return {"inserted": inserted, "updated": 0, "deleted": 0}
+
+def apply_incremental(cursor):
+    """Diff staging against medicines by sku_id and write only the rows that changed.
+
+    Readers keep seeing the previous rows (MVCC) until commit and only changed rows are locked.
+    """
+    columns = ", ".join(COLUMNS)
+    data_columns = [c for c in COLUMNS if c != "sku_id"]
+
+    print("Computing changes by sku_id...")
+    cursor.execute(f"""
+        CREATE TEMP TABLE incoming ON COMMIT DROP AS
+        SELECT DISTINCT ON (sku_id) file_order, line_no, {columns}
+        FROM {STAGING_TABLE}
+        ORDER BY sku_id, file_order, line_no;
+    """)
+    cursor.execute("CREATE UNIQUE INDEX ON incoming (sku_id);")
+    cursor.execute("ANALYZE incoming;")
+
+    cursor.execute("""
+        DELETE FROM medicines m
+        WHERE NOT EXISTS (SELECT 1 FROM incoming i WHERE i.sku_id = m.sku_id);
+    """)
+    deleted = cursor.rowcount
+
+    assignments = ", ".join(f"{c} = i.{c}" for c in data_columns)
+    current = ", ".join(f"m.{c}" for c in data_columns)
+    incoming = ", ".join(f"i.{c}" for c in data_columns)
+    cursor.execute(f"""
+        UPDATE medicines m
+        SET {assignments}, updated_at = CURRENT_TIMESTAMP
+        FROM incoming i
+        WHERE m.sku_id = i.sku_id
+          AND ({current}) IS DISTINCT FROM ({incoming})
+        RETURNING m.id;
+    """)
+    changed_ids = [row[0] for row in cursor.fetchall()]
+    updated = len(changed_ids)
+
+    cursor.execute(f"""
+        INSERT INTO medicines ({columns})
+        SELECT {columns}
+        FROM incoming i
+        WHERE NOT EXISTS (SELECT 1 FROM medicines m WHERE m.sku_id = i.sku_id)
+        ORDER BY file_order, line_no
+        RETURNING id;
+    """)
+    inserted_ids = [row[0] for row in cursor.fetchall()]
+    inserted = len(inserted_ids)
+
+    # Deleted medicines drop out of medicine_ingredients by ON DELETE CASCADE. An empty index
+    # (first import since the ingredient tables were added) is built for every medicine.
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM medicine_ingredients);")
+    medicine_ids = changed_ids + inserted_ids if cursor.fetchone()[0] else None
+    print("Indexing ingredients...")
+    print(f"  {index_ingredients(cursor, medicine_ids)} medicine ingredients")
+    return {"inserted": inserted, "updated": updated, "deleted": deleted}
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+def write_memory_snapshot(cursor, path):
+    """Rebuild the memory search backend's snapshot so workers don't keep serving the replaced data"""
+    from memory_index import MemoryIndex  # memory_index reads the JSON with this module's parsers
+
+    cursor.execute("SELECT version FROM data_version;")
+    row = cursor.fetchone()
+    index = MemoryIndex.from_json(DATA_DIR, os.getenv("MEMORY_COLLATION") or None, row[0] if row else 0)
+    index.save(path)
+    print(f"Wrote memory search snapshot {path}: {index.size} medicines, {index.stats()['snapshot_mb']} MB")
+
+def refresh_suggestions(conn, cursor, full):
+    """Rebuild name_suggestions, CONCURRENTLY for incremental imports so /suggest keeps reading it"""
+    cursor.execute("SELECT ispopulated FROM pg_matviews WHERE matviewname = 'name_suggestions';")
+    populated = cursor.fetchone()[0]
+    if populated:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM name_suggestions);")
+        populated = cursor.fetchone()[0]
+    if full or not populated:
+        # First population or a full reload: nothing worth keeping readable, the plain form is faster
+        cursor.execute("REFRESH MATERIALIZED VIEW name_suggestions;")
+        conn.commit()
+        return
+    conn.commit()
+    # CONCURRENTLY (needs the unique idx_name_suggestions) can't run inside a transaction block
+    conn.autocommit = True
+    try:
+        cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY name_suggestions;")
+    finally:
+        conn.autocommit = False
+
+def load_json_files(workers=None, full=False, snapshot=None):
     """Load all JSON data files from DB_Dataset/DB_Dataset/data/ into database"""
-    data_dir = Path("DB_Dataset/DB_Dataset/data")
-    
-    if not data_dir.exists():
-        print(f"Data directory not found: {data_dir}")
+    if not DATA_DIR.exists():
+        print(f"Data directory not found: {DATA_DIR}")
         return
-    
+
+    files = sorted(DATA_DIR.glob("*.json"))
+    workers = workers or min(len(files), os.cpu_count() or 1) or 1
+    start = time.perf_counter()
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    # Clear existing data
-    print("Clearing existing data...")
-    cursor.execute("TRUNCATE TABLE medicines RESTART IDENTITY;")
-    
-    all_medicines = []
-    files_processed = 0
-    
-    # Process all JSON files (a.json to z.json)
-    for json_file in sorted(data_dir.glob("*.json")):
-        print(f"Processing {json_file.name}...")
-        
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if not content:  # Skip empty files
-                    print(f"  Skipping empty file: {json_file.name}")
-                    continue
-                    
-                data = json.loads(content)
-                
-                # Handle different JSON structures
-                if isinstance(data, list):
-                    medicines = data
-                elif isinstance(data, dict) and 'medicines' in data:
-                    medicines = data['medicines']
-                elif isinstance(data, dict) and 'data' in data:
-                    medicines = data['data']
-                else:
-                    medicines = [data]  # Single medicine object
-                
-                for medicine in medicines:
-                    # Extract medicine data with default values
-                    medicine_data = {
-                        'sku_id': medicine.get('sku_id', medicine.get('id', '')),
-                        'name': medicine.get('name', ''),
-                        'manufacturer_name': medicine.get('manufacturer_name', medicine.get('manufacturer', '')),
-                        'marketer_name': medicine.get('marketer_name', medicine.get('marketer', '')),
-                        'type': medicine.get('type', medicine.get('category', 'unknown')),
-                        'price': float(medicine.get('price', 0.0)) if medicine.get('price') else 0.0,
-                        'pack_size_label': medicine.get('pack_size_label', medicine.get('pack_size', '')),
-                        'short_composition': medicine.get('short_composition', medicine.get('composition', ''))
-                    }
-                    
-                    if medicine_data['name']:  # Only add if name exists
-                        all_medicines.append(medicine_data)
-                
-                files_processed += 1
-                
-        except json.JSONDecodeError as e:
-            print(f"  Error parsing {json_file.name}: {e}")
-        except Exception as e:
-            print(f"  Error processing {json_file.name}: {e}")
-    
-    print(f"\nProcessed {files_processed} files, found {len(all_medicines)} medicines")
-    
-    if all_medicines:
-        # Remove duplicates by sku_id
-        print("Removing duplicates...")
-        seen_sku_ids = set()
-        unique_medicines = []
-        for med in all_medicines:
-            sku_id = med['sku_id'] or f"auto_{len(unique_medicines)}"  # Generate ID if empty
-            if sku_id not in seen_sku_ids:
-                seen_sku_ids.add(sku_id)
-                med['sku_id'] = sku_id
-                unique_medicines.append(med)
-        
-        print(f"Unique medicines after deduplication: {len(unique_medicines)}")
-        
-        # Insert all medicines into database
-        print("Inserting medicines into database...")
-        
-        insert_query = """
-        INSERT INTO medicines (sku_id, name, manufacturer_name, marketer_name, type, price, pack_size_label, short_composition)
-        VALUES %s
-        """
-        
-        medicine_values = [
-            (med['sku_id'], med['name'], med['manufacturer_name'], med['marketer_name'], med['type'], 
-             med['price'], med['pack_size_label'], med['short_composition'])
-            for med in unique_medicines
-        ]
-        
-        execute_values(cursor, insert_query, medicine_values, page_size=1000)
+    create_staging_table(cursor)
+    conn.commit()
+
+    print(f"Streaming {len(files)} files into {STAGING_TABLE} with {workers} workers...")
+    staged, failed = stage_files(files, workers)
+    print(f"\nStaged {staged} medicines")
+
+    if not staged or failed:
+        # A missing file would otherwise look like thousands of deleted medicines
+        print("No medicine data found to import!" if not staged else f"{failed} file(s) failed, nothing applied")
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE};")
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return
+
+    changes = apply_full(cursor) if full else apply_incremental(cursor)
+    cursor.execute(f"DROP TABLE {STAGING_TABLE};")
+    conn.commit()
+    if any(changes.values()):
+        refresh_suggestions(conn, cursor, full)
+        # Bumped after the refresh, so no suggestion cached under the new version predates it
+        cursor.execute("UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP;")
         conn.commit()
-        
-        print(f"Successfully imported {len(unique_medicines)} medicine records!")
-        
-        # Verify the import
-        cursor.execute("SELECT COUNT(*) FROM medicines;")
-        count = cursor.fetchone()[0]
-        print(f"Total medicines in database: {count}")
-        
-        # Show a few examples
-        cursor.execute("SELECT name, manufacturer_name, type FROM medicines LIMIT 5;")
-        examples = cursor.fetchall()
-        print("\nFirst 5 medicines:")
-        for i, (name, manufacturer, med_type) in enumerate(examples, 1):
-            print(f"  {i}. {name} by {manufacturer} ({med_type})")
-    else:
-        print("No medicine data found to import!")
-    
+    cursor.execute("ANALYZE medicines;")
+    cursor.execute("ANALYZE ingredients;")
+    cursor.execute("ANALYZE medicine_ingredients;")
+    conn.commit()
+
+    elapsed = time.perf_counter() - start
+    own_mb, workers_mb = peak_rss_mb()
+    print(f"Applied {'full' if full else 'incremental'} import: {changes['inserted']} inserted, "
+          f"{changes['updated']} updated, {changes['deleted']} deleted")
+    print(f"Elapsed: {elapsed:.2f}s ({staged / elapsed:,.0f} rows/sec staged)")
+    print(f"Peak RSS: {own_mb:.1f} MB (importer), {workers_mb:.1f} MB (largest worker)")
+
+    cursor.execute("SELECT COUNT(*) FROM medicines;")
+    print(f"Total medicines in database: {cursor.fetchone()[0]}")
+
+    if snapshot:
+        write_memory_snapshot(cursor, snapshot)
+
+    # Show a few examples
+    cursor.execute("SELECT name, manufacturer_name, type FROM medicines LIMIT 5;")
+    examples = cursor.fetchall()
+    print("\nFirst 5 medicines:")
+    for i, (name, manufacturer, med_type) in enumerate(examples, 1):
+        print(f"  {i}. {name} by {manufacturer} ({med_type})")
+
     cursor.close()
     conn.close()
 
 if __name__ == "__main__":
-    load_json_files()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Import medicine JSON files into PostgreSQL")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel file loaders (default: one per CPU)")
+    parser.add_argument("--full", action="store_true",
+                        help="Truncate and reload instead of applying only the changed rows")
+    memory_backend = os.getenv("SEARCH_BACKEND", "postgres") == "memory"
+    parser.add_argument("--snapshot", default=(os.getenv("MEMORY_SNAPSHOT") or None) if memory_backend else None,
+                        help="Memory search snapshot to rebuild after the import "
+                             "(default: MEMORY_SNAPSHOT when SEARCH_BACKEND=memory)")
+    args = parser.parse_args()
+    load_json_files(workers=args.workers, full=args.full, snapshot=args.snapshot)
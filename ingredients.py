@@ -0,0 +1,50 @@
+import re
+
+# Trailing "(strength)" of one component; earlier parentheses belong to the name, e.g. "Thiamine (Vitamin B1) (100mg)"
+COMPONENT_RE = re.compile(r"^(?P<name>.*?)\s*(?:\((?P<strength>[^()]*)\))?\s*$")
+
+
+def normalize_ingredient(name):
+    """Lower-case, single-spaced ingredient name with one space before any parenthesis"""
+    name = re.sub(r"\s*\(\s*", " (", name.lower())
+    name = re.sub(r"\s*\)", ")", name)
+    return " ".join(name.split())
+
+
+def normalize_strength(strength):
+    """'0.1 % w/v' and '0.1%w/v' compare equal"""
+    strength = "".join((strength or "").lower().split())
+    return strength or None
+
+
+def split_components(text):
+    """Split a composition on '+' signs that are not inside parentheses"""
+    parts = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(depth - 1, 0)
+        elif char == "+" and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def parse_composition(text):
+    """Parse "Paracetamol (500mg) + Caffeine (30mg)" into [("paracetamol", "500mg"), ("caffeine", "30mg")]"""
+    if not text:
+        return []
+    components = []
+    seen = set()
+    for part in split_components(text):
+        match = COMPONENT_RE.match(part.strip())
+        name = normalize_ingredient(match.group("name"))
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        components.append((name, normalize_strength(match.group("strength"))))
+    return components
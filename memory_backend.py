@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import rerank
+from memory_index import DATA_DIR, MemoryIndex, StaleSnapshotError, source_fingerprint
+
+
+class MemoryCursor:
+    """The part of a DB-API cursor the search functions use, answered by a MemoryIndex.
+
+    Statements are looked up in the backend's routes (SQL text -> MemoryIndex method name).
+    A SET sent ahead of a query in the same string, like the fuzzy threshold, is ignored:
+    its value travels in the query parameters too. Any other statement raises
+    NotImplementedError, which the API answers with 501 Not Implemented.
+    """
+
+    def __init__(self, index, routes):
+        self.index = index
+        self.routes = routes
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        method = self.routes.get(statement)
+        if method is None:
+            method = next((name for sql, name in self.routes.items() if statement.endswith(sql)), None)
+        if method is None:
+            raise NotImplementedError("Query not supported by the memory search backend, use SEARCH_BACKEND=postgres")
+        self._rows = getattr(self.index, method)(params or {})
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+
+class MemoryBackend:
+    """Stand-in for DatabasePool that serves searches from a MemoryIndex in process memory.
+
+    ``run(fn, *args)`` calls the same ``fn(cursor, *args)`` search functions, with a
+    MemoryCursor in place of a database cursor, on a small thread pool. The index is mapped
+    from MEMORY_SNAPSHOT when that file is current; otherwise it is built from the JSON data
+    files and, with MEMORY_SNAPSHOT set, written there for the next worker to map.
+
+    Fuzzy and full-text candidates are scored in NumPy batches when numpy is installed and
+    MEMORY_RERANK isn't "python"; both scorers return the same rows.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, snapshot=None, workers=2, collation=None, vectorized=True):
+        self.data_dir = Path(data_dir)
+        self.snapshot = Path(snapshot) if snapshot else None
+        self.workers = workers
+        self.collation = collation
+        self.vectorized = vectorized and rerank.available()
+        self.routes = {}
+        self.index = None
+        self.source = None
+        self.load_seconds = 0.0
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._queued = 0
+        self._calls_total = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            data_dir=os.getenv("MEMORY_DATA_DIR", str(DATA_DIR)),
+            snapshot=os.getenv("MEMORY_SNAPSHOT") or None,
+            workers=int(os.getenv("MEMORY_WORKERS", "2")),
+            collation=os.getenv("MEMORY_COLLATION") or None,
+            vectorized=os.getenv("MEMORY_RERANK", "numpy") != "python",
+        )
+
+    def route(self, sql, method):
+        """Answer ``sql`` with MemoryIndex.<method>(params)"""
+        self.routes[sql] = method
+
+    @property
+    def is_open(self):
+        return self._executor is not None
+
+    def load_index(self):
+        """Map MEMORY_SNAPSHOT when it is current, otherwise build from the JSON (and write the snapshot)"""
+        start = time.perf_counter()
+        self.index = None
+        if self.snapshot is not None and self.snapshot.exists():
+            try:
+                self.index = MemoryIndex.open(self.snapshot, source_fingerprint(self.data_dir), self.collation)
+                self.source = str(self.snapshot)
+            except StaleSnapshotError as e:
+                print(f"Ignoring snapshot {self.snapshot}: {e}")
+        if self.index is None:
+            self.index = MemoryIndex.from_json(self.data_dir, self.collation)
+            self.source = str(self.data_dir)
+            if self.snapshot is not None:
+                self.index.save(self.snapshot)
+                self.index = MemoryIndex.open(self.snapshot, collation=self.collation)
+                print(f"Wrote snapshot {self.snapshot}")
+        self.index.vectorized = self.vectorized
+        self.load_seconds = time.perf_counter() - start
+        print(f"Memory search index: {self.index.size} medicines from {self.source} in {self.load_seconds:.2f}s, "
+              f"{'numpy' if self.vectorized else 'python'} re-ranking")
+
+    def open(self):
+        if self._executor is not None:
+            return
+        self.load_index()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="memory-search")
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.index = None
+
+    def connection(self, timeout=None):
+        raise RuntimeError("The memory search backend has no database connection")
+
+    def _execute(self, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._in_use += 1
+            self._calls_total += 1
+        try:
+            return fn(MemoryCursor(self.index, self.routes), *args)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+
+    def _cancelled_while_queued(self, future):
+        # A call abandoned before a worker picked it up (e.g. a deadline) never reaches _execute
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn, *args):
+        """Run ``fn(cursor, *args)`` against the in-memory index without blocking the event loop"""
+        if self._executor is None:
+            raise RuntimeError("Memory search backend is not open")
+        with self._lock:
+            self._queued += 1
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, self._execute, fn, args)
+        future.add_done_callback(self._cancelled_while_queued)
+        return await asyncio.wrap_future(future)
+
+    async def run_with_deadline(self, deadline, fn, *args):
+        """Like run(), but stop waiting after ``deadline`` seconds; the search itself runs to completion"""
+        return await asyncio.wait_for(self.run(fn, *args), deadline)
+
+    def stats(self):
+        # Same keys as DatabasePool.stats(), so /metrics reads either backend
+        with self._lock:
+            return {
+                "backend": "memory",
+                "max_size": self.workers,
+                "in_use": self._in_use,
+                "waiting": self._queued,
+                "acquired_total": self._calls_total,
+                "timeouts_total": 0,
+                "source": self.source,
+                "load_seconds": round(self.load_seconds, 3),
+                "index": self.index.stats() if self.index is not None else None,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the in-memory search index snapshot from the JSON data files")
+    parser.add_argument("snapshot", help="Snapshot file to write, mapped by workers via MEMORY_SNAPSHOT")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--data-version", type=int, default=0, help="Version reported to the result cache")
+    args = parser.parse_args()
+    index = MemoryIndex.from_json(args.data_dir, os.getenv("MEMORY_COLLATION") or None, args.data_version)
+    index.save(args.snapshot)
+    print(f"Wrote {index.size} medicines to {args.snapshot} ({index.stats()['snapshot_mb']} MB, "
+          f"built in {index.build_seconds:.2f}s)")
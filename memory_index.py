@@ -0,0 +1,643 @@
+import hashlib
+import heapq
+import locale
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+
+import rerank
+from import_data import DATA_DIR, extract_medicine, iter_json_records
+
+# Snapshot layout: header, section table, then 8-byte aligned sections of native byte order arrays.
+# Bump SNAPSHOT_FORMAT whenever the layout or anything computed into the snapshot changes.
+SNAPSHOT_MAGIC = b"MEDIDX\0\0"
+SNAPSHOT_FORMAT = 2
+# magic, format, little-endian, data_version, source fingerprint, collation, section count, crc32
+HEADER = struct.Struct("<8sI?Q32s64sII")
+# name, offset, length
+SECTION = struct.Struct("<24sQQ")
+
+# Snapshot sections that make up the search indexes, as opposed to the column data
+INDEX_SECTIONS = ("name_lower", "prefix_order", "name_rank", "substring", "fuzzy", "text")
+
+# Alphanumeric runs; pg_trgm and the text search parser both treat everything else as a separator
+WORD_RE = re.compile(r"[^\W_]+")
+
+# Quoted phrase or bare word of a websearch-style query
+QUERY_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# ts_rank weights of search_vector's A (name), B (composition) and C (manufacturer) labels
+FIELD_WEIGHTS = (1.0, 0.4, 0.2)
+
+# The common part of Postgres' english stop word list
+STOPWORDS = frozenset("""
+    a about above after again against all am an and any are as at be because been before being below
+    between both but by can did do does doing down during each few for from further had has have having
+    he her here hers him his how i if in into is it its itself just me more most my no nor not now of off
+    on once only or other our ours out over own same she should so some such than that the their theirs
+    them then there these they this those through to too under until up very was we were what when where
+    which while who whom why will with you your yours
+""".split())
+
+
+def word_trigrams(text):
+    """pg_trgm's trigrams of text in order: each lower-cased word padded as '  word '"""
+    grams = []
+    for word in WORD_RE.findall(text.lower()):
+        padded = f"  {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def word_similarity(query, sequence):
+    """Greatest count / (|query| + |extent| - count) over contiguous extents of a name's trigram sequence.
+
+    ``query`` is the set of query trigrams, ``count`` the ones an extent contains; the same
+    measure as pg_trgm's word_similarity(q, name), searched exhaustively instead of greedily.
+    """
+    best = 0.0
+    size = len(query)
+    for start, gram in enumerate(sequence):
+        if gram not in query:
+            continue
+        seen = set()
+        common = set()
+        for end in range(start, len(sequence)):
+            gram = sequence[end]
+            seen.add(gram)
+            if gram in query:
+                common.add(gram)
+                score = len(common) / (size + len(seen) - len(common))
+                if score > best:
+                    best = score
+    return best
+
+
+def substring_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def stem(word):
+    """Fold plurals together; a much lighter stemmer than Postgres' snowball, applied the same way to both sides"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def lexemes(text):
+    return [stem(word) for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def parse_websearch(q):
+    """Split a websearch_to_tsquery-style query into (clauses, excluded).
+
+    Every clause must match, a clause matching when any of its lexemes is present; ``or``
+    between two words joins them into one clause and a leading ``-`` excludes a word.
+    Quoted phrases are treated as their words, without the adjacency check.
+    """
+    clauses = []
+    excluded = []
+    joined = False
+    for phrase, word in QUERY_TOKEN_RE.findall(q):
+        if not phrase and word.lower() == "or":
+            joined = bool(clauses)
+            continue
+        negated = not phrase and word.startswith("-")
+        terms = lexemes(phrase or word.lstrip("-"))
+        if not terms:
+            continue
+        if negated:
+            excluded.extend(terms)
+        elif joined:
+            clauses[-1].append(terms[0])
+            clauses.extend([term] for term in terms[1:])
+        else:
+            clauses.extend([term] for term in terms)
+        joined = False
+    return clauses, excluded
+
+
+class StaleSnapshotError(Exception):
+    """Raised when a snapshot can't be used: unknown format, corrupt, or built from other data"""
+
+
+class StringPool:
+    """Strings stored as UTF-8 end to end plus n + 1 offsets, decoded on access"""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+
+class SortedKeys:
+    """name_lower of each row in prefix order, a sequence bisect can search"""
+
+    def __init__(self, names, order):
+        self.names = names
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, pos):
+        return self.names[self.order[pos]]
+
+
+class Postings:
+    """Sorted keys, each owning a slice of one shared rows array (and an optional parallel labels array)"""
+
+    def __init__(self, keys, offsets, rows, labels=None):
+        self.keys = keys
+        self.offsets = offsets
+        self.rows = rows
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.keys)
+
+    def position(self, key):
+        """Index of key among the keys, None when it has no postings"""
+        pos = bisect_left(self.keys, key)
+        return pos if pos < len(self.keys) and self.keys[pos] == key else None
+
+    def _range(self, key):
+        pos = self.position(key)
+        if pos is None:
+            return 0, 0
+        return self.offsets[pos], self.offsets[pos + 1]
+
+    def get(self, key):
+        start, end = self._range(key)
+        return self.rows[start:end]
+
+    def labeled(self, key):
+        start, end = self._range(key)
+        return self.rows[start:end], self.labels[start:end]
+
+
+def source_fingerprint(data_dir=DATA_DIR):
+    """Digest of the JSON files' names, sizes and modification times, None when there are none"""
+    files = sorted(Path(data_dir).glob("*.json"))
+    if not files:
+        return None
+    digest = hashlib.sha256()
+    for path in files:
+        stat = path.stat()
+        digest.update(f"{path.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.digest()
+
+
+def read_columns(data_dir=DATA_DIR):
+    """Read the JSON files import_data.py loads, keeping the first record of each sku_id.
+
+    Returns the string pool and one column per field; text columns hold pool indexes.
+    """
+    strings = []
+    codes = {}
+
+    def intern(value):
+        value = value or ""
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(strings)
+            strings.append(value)
+        return code
+
+    columns = {"name": array("I"), "manufacturer": array("I"), "type": array("I"), "price": array("d"),
+               "pack_size": array("I"), "composition": array("I"), "discontinued": bytearray()}
+    seen = set()
+    for path in sorted(Path(data_dir).glob("*.json")):
+        for line_no, medicine in enumerate(iter_json_records(path)):
+            values = extract_medicine(medicine)
+            if values is None:
+                continue
+            sku_id = values[0] or f"auto_{path.stem}_{line_no}"
+            if sku_id in seen:
+                continue
+            seen.add(sku_id)
+            _, name, manufacturer, _, med_type, price, pack_size, composition, discontinued, _ = values
+            columns["name"].append(intern(name))
+            columns["manufacturer"].append(intern(manufacturer))
+            columns["type"].append(intern(med_type))
+            columns["price"].append(round(price, 2))
+            columns["pack_size"].append(intern(pack_size))
+            columns["composition"].append(intern(composition))
+            columns["discontinued"].append(discontinued)
+    return strings, columns
+
+
+def pack_strings(values):
+    data = bytearray()
+    offsets = array("I", [0])
+    for value in values:
+        data += value.encode("utf-8")
+        offsets.append(len(data))
+    return bytes(data), offsets
+
+
+def pack_postings(name, postings, sections, labeled=False):
+    """Add {key: {row: label}} postings to sections as sorted keys, offsets, rows and (if labeled) labels"""
+    keys = sorted(postings)
+    sections[name + ".keys"], sections[name + ".key_offsets"] = pack_strings(keys)
+    offsets = array("I", [0])
+    rows = array("I")
+    labels = bytearray()
+    for key in keys:
+        rows.extend(postings[key])
+        labels.extend(postings[key].values())
+        offsets.append(len(rows))
+    sections[name + ".offsets"] = offsets
+    sections[name + ".rows"] = rows
+    if labeled:
+        sections[name + ".labels"] = labels
+
+
+def build_snapshot(data_dir=DATA_DIR, collation=None, data_version=0):
+    """Read the JSON files and build every index, returned as snapshot bytes (see MemoryIndex)"""
+    fingerprint = source_fingerprint(data_dir)
+    strings, columns = read_columns(data_dir)
+    size = len(columns["name"])
+    names = [strings[code] for code in columns["name"]]
+    name_lower = [name.lower() for name in names]
+
+    sections = {}
+    sections["strings"], sections["strings.offsets"] = pack_strings(strings)
+    sections.update(columns)
+    sections["name_lower"], sections["name_lower.offsets"] = pack_strings(name_lower)
+
+    # Prefix search: row numbers in (name_lower, id) order, code point order like COLLATE "C"
+    sections["prefix_order"] = array("I", sorted(range(size), key=name_lower.__getitem__))
+
+    # Position of each row in ORDER BY name, id; MEMORY_COLLATION matches the database's collation
+    if collation:
+        locale.setlocale(locale.LC_COLLATE, collation)
+        collate = locale.strxfrm
+    else:
+        collate = str
+    name_rank = array("I", [0]) * size
+    for rank, i in enumerate(sorted(range(size), key=lambda i: collate(names[i]))):
+        name_rank[i] = rank
+    sections["name_rank"] = name_rank
+
+    substring = {}
+    fuzzy = {}
+    text = {}
+    for i, lowered in enumerate(name_lower):
+        for gram in substring_trigrams(lowered):
+            substring.setdefault(gram, {})[i] = 0
+        for gram in set(word_trigrams(lowered)):
+            fuzzy.setdefault(gram, {})[i] = 0
+        # Best (lowest) label each lexeme appears under in this row
+        labels = {}
+        for label, column in enumerate(("name", "composition", "manufacturer")):
+            for lexeme in lexemes(strings[columns[column][i]]):
+                labels.setdefault(lexeme, label)
+        for lexeme, label in labels.items():
+            text.setdefault(lexeme, {})[i] = label
+    # Each name's word trigrams in order, as positions in the fuzzy keys, for batch re-ranking
+    gram_ids = {gram: k for k, gram in enumerate(sorted(fuzzy))}
+    sequence = array("I")
+    sequence_offsets = array("I", [0])
+    for lowered in name_lower:
+        sequence.extend(gram_ids[gram] for gram in word_trigrams(lowered))
+        sequence_offsets.append(len(sequence))
+    sections["fuzzy.sequence"] = sequence
+    sections["fuzzy.sequence_offsets"] = sequence_offsets
+    pack_postings("substring", substring, sections)
+    pack_postings("fuzzy", fuzzy, sections)
+    pack_postings("text", text, sections, labeled=True)
+    return pack_snapshot(sections, data_version, fingerprint, collation)
+
+
+def pack_snapshot(sections, data_version, fingerprint, collation):
+    table_size = HEADER.size + SECTION.size * len(sections)
+    table = bytearray()
+    body = bytearray()
+    for name, data in sections.items():
+        # Sections start 8-byte aligned so they can be cast to typed views in place
+        body += bytes(-(table_size + len(body)) % 8)
+        table += SECTION.pack(name.encode(), table_size + len(body), len(memoryview(data).cast("B")))
+        body += memoryview(data).cast("B")
+    checksum = zlib.crc32(body, zlib.crc32(table))
+    header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, sys.byteorder == "little", data_version,
+                         fingerprint or bytes(32), (collation or "").encode(), len(sections), checksum)
+    return header + table + body
+
+
+def unpack_snapshot(buffer):
+    view = memoryview(buffer)
+    if len(view) < HEADER.size:
+        raise StaleSnapshotError("file is truncated")
+    magic, version, little, data_version, fingerprint, collation, count, checksum = HEADER.unpack_from(view)
+    if magic != SNAPSHOT_MAGIC:
+        raise StaleSnapshotError("not a medicine index snapshot")
+    if version != SNAPSHOT_FORMAT:
+        raise StaleSnapshotError(f"snapshot format {version}, this version reads {SNAPSHOT_FORMAT}")
+    if bool(little) != (sys.byteorder == "little"):
+        raise StaleSnapshotError("snapshot was written on a machine with the other byte order")
+    if zlib.crc32(view[HEADER.size:]) != checksum:
+        raise StaleSnapshotError("checksum mismatch, the file is corrupt or was partially written")
+    sections = {}
+    for k in range(count):
+        name, offset, length = SECTION.unpack_from(view, HEADER.size + k * SECTION.size)
+        sections[name.rstrip(b"\0").decode()] = view[offset:offset + length]
+    return {
+        "data_version": data_version,
+        "fingerprint": None if fingerprint == bytes(32) else fingerprint,
+        "collation": collation.rstrip(b"\0").decode() or None,
+        "sections": sections,
+    }
+
+
+class MemoryIndex:
+    """Read-only copy of the medicines table with its own search indexes, no database involved.
+
+    Everything lives in one snapshot buffer: a de-duplicated string pool that the text
+    columns index into, typed column arrays, and the indexes - a name_lower sort order for
+    prefix search, a substring trigram index for ILIKE-style search, pg_trgm-style word
+    trigrams for fuzzy search and a weighted lexeme index for full-text search. Row i is
+    medicine id i + 1, numbered in import order like a full import_data.py load.
+
+    Built in memory by from_json() or mapped read-only from a snapshot file by open(), in
+    which case every worker shares the same pages through the OS page cache.
+
+    The search methods take the same parameter dicts as the SQL they stand in for and
+    return rows in the same column layout, so pagination and result shaping are shared.
+    """
+
+    def __init__(self, buffer):
+        snapshot = unpack_snapshot(buffer)
+        self.buffer = buffer
+        self.version = snapshot["data_version"]
+        self.fingerprint = snapshot["fingerprint"]
+        self.collation = snapshot["collation"]
+        sections = self.sections = snapshot["sections"]
+
+        def u32(name):
+            return sections[name].cast("I")
+
+        def pool(name):
+            return StringPool(sections[name], u32(name + ".offsets"))
+
+        def postings(name, labels=False):
+            return Postings(StringPool(sections[name + ".keys"], u32(name + ".key_offsets")),
+                            u32(name + ".offsets"), u32(name + ".rows"),
+                            sections[name + ".labels"] if labels else None)
+
+        self.strings = pool("strings")
+        self.name = u32("name")
+        self.manufacturer = u32("manufacturer")
+        self.type = u32("type")
+        self.price = sections["price"].cast("d")
+        self.pack_size = u32("pack_size")
+        self.composition = u32("composition")
+        self.discontinued = sections["discontinued"]
+        self.size = len(self.name)
+        self.name_lower = pool("name_lower")
+        self.prefix_order = u32("prefix_order")
+        self.prefix_keys = SortedKeys(self.name_lower, self.prefix_order)
+        self.name_rank = u32("name_rank")
+        self.substring_postings = postings("substring")
+        self.fuzzy_postings = postings("fuzzy")
+        self.fuzzy_sequence = sections["fuzzy.sequence"]
+        self.fuzzy_sequence_offsets = sections["fuzzy.sequence_offsets"]
+        self.text_postings = postings("text", labels=True)
+        self.build_seconds = 0.0
+        # Score fuzzy and full-text candidates in NumPy batches (rerank.py) when it is installed
+        self.vectorized = rerank.available()
+
+    @classmethod
+    def from_json(cls, data_dir=DATA_DIR, collation=None, data_version=0):
+        start = time.perf_counter()
+        index = cls(build_snapshot(data_dir, collation, data_version))
+        index.build_seconds = time.perf_counter() - start
+        return index
+
+    @classmethod
+    def open(cls, path, fingerprint=None, collation=None):
+        """Map a snapshot file read-only.
+
+        Raises StaleSnapshotError when it isn't a readable snapshot, was built with another
+        collation, or (given the current source_fingerprint()) from other data files.
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = cls(mapped)
+        if fingerprint is not None and index.fingerprint is not None and index.fingerprint != fingerprint:
+            raise StaleSnapshotError("the JSON data files changed since the snapshot was built")
+        if index.collation != collation:
+            raise StaleSnapshotError(f"built with collation {index.collation!r}, configured {collation!r}")
+        return index
+
+    def save(self, path):
+        """Write the snapshot next to path and rename it into place, so readers never see a partial file"""
+        path = Path(path)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(self.buffer)
+        os.replace(tmp, path)
+
+    def medicine(self, i):
+        strings = self.strings
+        return (strings[self.name[i]], strings[self.manufacturer[i]], strings[self.type[i]], self.price[i],
+                strings[self.pack_size[i]], strings[self.composition[i]])
+
+    def _filter(self, params):
+        """Row predicate for the FILTER_SQL parameters, None when no filter is set"""
+        med_type = params.get("f_type")
+        manufacturer = params.get("f_manufacturer")
+        min_price = params.get("f_min_price")
+        max_price = params.get("f_max_price")
+        active_only = params.get("f_exclude_discontinued")
+        if med_type is None and manufacturer is None and min_price is None and max_price is None and not active_only:
+            return None
+        strings = self.strings
+
+        def accepts(i):
+            return ((med_type is None or strings[self.type[i]] == med_type)
+                    and (manufacturer is None or strings[self.manufacturer[i]] == manufacturer)
+                    and (min_price is None or self.price[i] >= min_price)
+                    and (max_price is None or self.price[i] <= max_price)
+                    and not (active_only and self.discontinued[i]))
+        return accepts
+
+    def _after_rank(self, after_id):
+        """name_rank of the cursor's last row, -1 before the first page"""
+        return self.name_rank[after_id - 1] if 0 < after_id <= self.size else -1
+
+    def prefix(self, params):
+        low, high = params["low"], params["high"]
+        after = (params["after_name"], params["after_id"])
+        accepts = self._filter(params)
+        keys = self.prefix_keys
+        rows = []
+        pos = bisect_left(keys, max(low, after[0]))
+        while pos < self.size and len(rows) < params["limit"]:
+            key = keys[pos]
+            if key >= high:
+                break
+            i = self.prefix_order[pos]
+            pos += 1
+            if (key, i + 1) <= after or (accepts is not None and not accepts(i)):
+                continue
+            rows.append(self.medicine(i) + (key, i + 1))
+        return rows
+
+    def substring(self, params):
+        # Undo escape_like(): the pattern is matched literally here
+        q = re.sub(r"\\(.)", r"\1", params["pattern"]).lower()
+        grams = substring_trigrams(q)
+        if grams:
+            postings = sorted((self.substring_postings.get(gram) for gram in grams), key=len)
+            candidates = set(postings[0])
+            for rows in postings[1:]:
+                candidates.intersection_update(rows)
+        else:
+            candidates = range(self.size)
+        accepts = self._filter(params)
+        after_rank = self._after_rank(params["after_id"])
+        matches = [
+            i for i in candidates
+            if q in self.name_lower[i] and self.name_rank[i] > after_rank and (accepts is None or accepts(i))
+        ]
+        return [self.medicine(i) + (i + 1,)
+                for i in heapq.nsmallest(params["limit"], matches, key=self.name_rank.__getitem__)]
+
+    def fulltext(self, params):
+        clauses, excluded = parse_websearch(params["q"])
+        if not clauses:
+            return []
+        if self.vectorized:
+            return self._fulltext_batch(params, clauses, excluded)
+        scores = None
+        for clause in clauses:
+            # Weight of the best label under which any of the clause's lexemes appears, per row
+            weights = {}
+            for lexeme in clause:
+                rows, labels = self.text_postings.labeled(lexeme)
+                for i, label in zip(rows, labels):
+                    weight = FIELD_WEIGHTS[label]
+                    if weight > weights.get(i, 0.0):
+                        weights[i] = weight
+            if scores is None:
+                scores = weights
+            else:
+                scores = {i: score + weights[i] for i, score in scores.items() if i in weights}
+            if not scores:
+                return []
+        for lexeme in excluded:
+            for i in self.text_postings.get(lexeme):
+                scores.pop(i, None)
+
+        accepts = self._filter(params)
+        after = (params["after_rank"], self._after_rank(params["after_id"]))
+        ranked = []
+        for i, score in scores.items():
+            # Normalization 32 of ts_rank_cd: rank / (rank + 1)
+            rank = score / (score + 1)
+            key = (-rank, self.name_rank[i])
+            if key > after and (accepts is None or accepts(i)):
+                ranked.append((key, i, rank))
+        return [self.medicine(i) + (rank, i + 1) for _, i, rank in heapq.nsmallest(params["limit"], ranked)]
+
+    def fuzzy(self, params):
+        q = params["q"]
+        threshold = params["threshold"]
+        query = set(word_trigrams(q))
+        if not query:
+            return []
+        # An extent sharing `count` trigrams scores at most count / |query|, so rows sharing
+        # fewer than threshold * |query| trigrams with the query can't reach the threshold
+        needed = math.ceil(threshold * len(query) - 1e-9)
+        if self.vectorized:
+            return self._fuzzy_batch(params, query, needed)
+        if needed > 0:
+            hits = Counter()
+            for gram in query:
+                hits.update(self.fuzzy_postings.get(gram))
+            candidates = [i for i, count in hits.items() if count >= needed]
+        else:
+            candidates = range(self.size)
+
+        accepts = self._filter(params)
+        after = (params["after_distance"], self._after_rank(params["after_id"]))
+        ranked = []
+        for i in candidates:
+            if accepts is not None and not accepts(i):
+                continue
+            similarity = word_similarity(query, word_trigrams(self.name_lower[i]))
+            if similarity < threshold:
+                continue
+            key = (1.0 - similarity, self.name_rank[i])
+            if key > after:
+                ranked.append((key, i, similarity))
+        return [self.medicine(i) + (similarity, key[0], i + 1)
+                for key, i, similarity in heapq.nsmallest(params["limit"], ranked)]
+
+    def _fulltext_batch(self, params, clauses, excluded):
+        """fulltext() with the postings merged and ranked as NumPy arrays"""
+        postings = self.text_postings
+        ranked = rerank.fulltext_rank(
+            [[postings.labeled(lexeme) for lexeme in clause] for clause in clauses],
+            [postings.get(lexeme) for lexeme in excluded], FIELD_WEIGHTS, rerank.u32(self.name_rank),
+            (params["after_rank"], self._after_rank(params["after_id"])), params["limit"], self._filter(params))
+        return [self.medicine(i) + (rank, i + 1) for i, rank in ranked]
+
+    def _fuzzy_batch(self, params, query, needed):
+        """fuzzy() with the candidates gathered and scored as NumPy arrays"""
+        postings = self.fuzzy_postings
+        query_ids = [pos for pos in map(postings.position, query) if pos is not None]
+        candidates, counts = rerank.trigram_hits([postings.get(gram) for gram in query], self.size, needed)
+        ranked = rerank.fuzzy_rank(
+            candidates, counts, query_ids, len(query), params["threshold"], rerank.u32(self.fuzzy_sequence),
+            rerank.u32(self.fuzzy_sequence_offsets), rerank.u32(self.name_rank),
+            (params["after_distance"], self._after_rank(params["after_id"])), params["limit"], self._filter(params))
+        return [self.medicine(i) + (similarity, distance, i + 1) for i, similarity, distance in ranked]
+
+    def ping(self, params):
+        return [(1,)]
+
+    def catalog(self, params):
+        return [(self.size, len(self.buffer), self.version)]
+
+    def index_sizes(self, params):
+        sizes = {}
+        for name, view in self.sections.items():
+            group = name.split(".")[0]
+            if group in INDEX_SECTIONS:
+                sizes[group] = sizes.get(group, 0) + view.nbytes
+        return [("medicines", group, size) for group, size in sorted(sizes.items())]
+
+    def data_version(self, params):
+        return [(self.version,)]
+
+    def stats(self):
+        return {
+            "rows": self.size,
+            "data_version": self.version,
+            "snapshot_mb": round(len(self.buffer) / 2**20, 1),
+            "mapped": isinstance(self.buffer, mmap.mmap),
+            "strings": len(self.strings),
+            "substring_trigrams": len(self.substring_postings),
+            "fuzzy_trigrams": len(self.fuzzy_postings),
+            "lexemes": len(self.text_postings),
+            "vectorized": self.vectorized,
+            "build_seconds": round(self.build_seconds, 3),
+        }
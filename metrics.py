@@ -0,0 +1,169 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Latency buckets in seconds, from sub-millisecond index lookups up to slow scans
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+current_timer = ContextVar("current_timer", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition model"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = []
+            running = 0
+            for count in self.counts:
+                running += count
+                cumulative.append(running)
+            return cumulative, self.total, self.count
+
+
+class MetricsRegistry:
+    """Labelled histograms and counters rendered as Prometheus text"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self, extra=()):
+        """Prometheus text format; `extra` adds (name, kind, help, labels, value) samples read at scrape time"""
+        lines = []
+        described = set()
+
+        def header(name, kind, text):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        for (name, labels), histogram in histograms:
+            header(name, "histogram", self._help.get(name, ("", name))[1])
+            cumulative, total, count = histogram.snapshot()
+            for bound, value in zip(histogram.buckets, cumulative):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', repr(bound)),))} {value}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            header(name, "counter", self._help.get(name, ("", name))[1])
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name, kind, text, labels, value in extra:
+            header(name, kind, text)
+            lines.append(f"{name}{format_labels(tuple(sorted(labels.items())))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+registry = MetricsRegistry()
+registry.describe("search_stage_seconds", "histogram", "Time spent in each hot-path stage of a search request")
+registry.describe("search_request_seconds", "histogram", "End-to-end search handler time")
+registry.describe("search_requests_total", "counter", "Search requests served")
+
+
+class RequestTimer:
+    """Collects per-stage durations (acquire, execute, fetch, rank, serialize) for one search request"""
+
+    def __init__(self, search_type):
+        self.search_type = search_type
+        self.started = time.perf_counter()
+        self.stages = {}
+        # Stages are added from executor threads, concurrently when a search runs several queries
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.stages.items())
+
+    def finish(self):
+        total = time.perf_counter() - self.started
+        for name, seconds in self.snapshot():
+            registry.observe("search_stage_seconds", seconds, type=self.search_type, stage=name)
+        registry.observe("search_request_seconds", total, type=self.search_type)
+        registry.inc("search_requests_total", type=self.search_type)
+        return total
+
+    def server_timing(self):
+        """Value for the Server-Timing response header"""
+        entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.snapshot()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.3f}")
+        return ", ".join(entries)
+
+
+def start_timer(search_type):
+    timer = RequestTimer(search_type)
+    current_timer.set(timer)
+    return timer
+
+
+def add_stage(name, seconds):
+    timer = current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as `name` on the current request's timer, if there is one"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage(name, time.perf_counter() - start)
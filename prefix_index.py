@@ -0,0 +1,116 @@
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+
+class PrefixIndex:
+    """In-memory autocomplete index: lower-cased names in a sorted array searched with bisect.
+
+    Rows are kept in the same (name_lower, id) order that idx_name_prefix serves, so a
+    prefix lookup returns exactly what the SQL range scan would without a round trip.
+    Each row ends with its (name_lower, id) sort key, matching the prefix SQL's columns.
+    """
+
+    LOAD_SQL = """
+        SELECT id, name_lower, name, manufacturer_name, type, price::float8 AS price, pack_size_label, short_composition
+        FROM medicines
+        ORDER BY name_lower, id
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self._data = None  # (keys, rows), swapped as one reference on refresh
+        self._refresh_lock = threading.Lock()
+        self.built_at = None
+        self.build_seconds = 0.0
+        self.memory = {}
+
+    @property
+    def ready(self):
+        return self._data is not None
+
+    def load_from_cursor(self, cursor):
+        """Build the index from the medicines table; the previous data keeps serving until the swap"""
+        with self._refresh_lock:
+            start = time.perf_counter()
+            cursor.execute(self.LOAD_SQL)
+            keys = []
+            rows = []
+            for med_id, name_lower, name, manufacturer, med_type, price, pack_size, composition in cursor:
+                keys.append(name_lower)
+                # Manufacturer and type repeat across thousands of rows, share one string each
+                rows.append((
+                    name,
+                    sys.intern(manufacturer) if manufacturer else manufacturer,
+                    sys.intern(med_type) if med_type else med_type,
+                    price,
+                    pack_size,
+                    composition,
+                    name_lower,
+                    med_id,
+                ))
+            memory = self._measure(keys, rows)
+            if self.max_bytes is not None and memory["total_bytes"] > self.max_bytes:
+                raise MemoryError(
+                    f"Prefix index needs {memory['total_mb']} MB, over the {self.max_bytes / 2**20:.0f} MB budget"
+                )
+            self._data = (keys, rows)
+            self.memory = memory
+            self.build_seconds = time.perf_counter() - start
+            self.built_at = time.time()
+            return len(keys)
+
+    def clear(self):
+        self._data = None
+
+    def search(self, q, limit=100, after=None):
+        """Rows whose lower-cased name starts with q, in index order, after the (name_lower, id) key"""
+        data = self._data
+        if data is None:
+            raise RuntimeError("Prefix index has not been built")
+        keys, rows = data
+        prefix = q.lower()
+        start = bisect_left(keys, prefix)
+        if after is not None:
+            after_name, after_id = after
+            start = bisect_left(keys, after_name, start)
+            while start < len(keys) and keys[start] == after_name and rows[start][7] <= after_id:
+                start += 1
+        results = []
+        for i in range(start, min(start + limit, len(keys))):
+            if not keys[i].startswith(prefix):
+                break
+            results.append(rows[i])
+        return results
+
+    @staticmethod
+    def _measure(keys, rows):
+        seen = set()
+
+        def size(obj):
+            # Interned strings are shared, count each object once
+            if id(obj) in seen:
+                return 0
+            seen.add(id(obj))
+            return sys.getsizeof(obj)
+
+        keys_bytes = sys.getsizeof(keys) + sum(size(k) for k in keys)
+        rows_bytes = sys.getsizeof(rows) + sum(size(r) + sum(size(v) for v in r) for r in rows)
+        total = keys_bytes + rows_bytes
+        return {
+            "entries": len(keys),
+            "keys_bytes": keys_bytes,
+            "rows_bytes": rows_bytes,
+            "total_bytes": total,
+            "total_mb": round(total / 2**20, 1),
+        }
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "built_at": self.built_at,
+            "build_seconds": round(self.build_seconds, 3),
+            "budget_mb": round(self.max_bytes / 2**20, 1) if self.max_bytes is not None else None,
+            "memory": self.memory,
+        }
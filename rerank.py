@@ -0,0 +1,197 @@
+try:
+    import numpy as np
+except ImportError:
+    # Optional: without numpy the memory backend scores candidates one at a time in Python
+    np = None
+
+# Fuzzy candidates scored per batch, highest trigram bound first
+BATCH_SIZE = 1024
+
+
+def available():
+    return np is not None
+
+
+def u32(view):
+    """Zero-copy uint32 array over a snapshot section (or a slice of one)"""
+    return np.frombuffer(view, dtype=np.uint32)
+
+
+def pad_sequences(values, offsets, rows):
+    """The values[offsets[i]:offsets[i + 1]] slice of each row, -1 padded into one (rows, width) matrix.
+
+    Returns the matrix and each row's unpadded length.
+    """
+    starts = offsets[rows].astype(np.int64)
+    lengths = offsets[rows + 1].astype(np.int64) - starts
+    width = int(lengths.max()) if len(rows) else 0
+    columns = np.arange(width)
+    valid = columns < lengths[:, None]
+    matrix = np.full((len(rows), width), -1, dtype=np.int64)
+    matrix[valid] = values[(starts[:, None] + columns)[valid]]
+    return matrix, lengths
+
+
+def previous_occurrence(matrix, valid):
+    """Column of the previous occurrence of the same value in the same row, -1 for a first occurrence"""
+    rows, columns = np.nonzero(valid)
+    # One sort key per cell: row-major, then value; the stable sort keeps equal cells in column order
+    keys = rows * (int(matrix.max()) + 1) + matrix[rows, columns]
+    order = np.argsort(keys, kind="stable")
+    keys, rows, columns = keys[order], rows[order], columns[order]
+    repeated = np.flatnonzero(keys[1:] == keys[:-1]) + 1
+    previous = np.full(matrix.shape, -1, dtype=np.int64)
+    previous[rows[repeated], columns[repeated]] = columns[repeated - 1]
+    return previous
+
+
+def word_similarity_batch(matrix, lengths, query_ids, size):
+    """memory_index.word_similarity() for every row of a padded trigram id matrix at once.
+
+    For each start column holding a query trigram, the rows starting an extent there get
+    running counts of distinct trigrams (seen) and distinct query trigrams (common) along
+    the row, and keep the best common / (size + seen - common). ``size`` is the number of
+    query trigrams, including any that no name contains and so have no id.
+    """
+    best = np.zeros(len(matrix))
+    if not matrix.size:
+        return best
+    in_query = np.isin(matrix, query_ids)
+    # Rows without a query trigram score 0; only the others are scored, trimmed to their width
+    active = np.flatnonzero(in_query.any(axis=1))
+    if not len(active):
+        return best
+    width = int(lengths[active].max())
+    matrix, in_query = matrix[active, :width], in_query[active, :width]
+    valid = np.arange(width) < lengths[active, None]
+    previous = previous_occurrence(matrix, valid)
+    scores = np.zeros(len(active))
+    for start in np.flatnonzero(in_query.any(axis=0)):
+        rows = np.flatnonzero(in_query[:, start])
+        # Distinct within the extent: the trigram's last occurrence lies before the extent
+        first = (previous[rows, start:] < start) & valid[rows, start:]
+        seen = np.cumsum(first, axis=1)
+        common = np.cumsum(first & in_query[rows, start:], axis=1)
+        scores[rows] = np.maximum(scores[rows], (common / (size + seen - common)).max(axis=1))
+    best[active] = scores
+    return best
+
+
+def top_k(distance, rank, k):
+    """Positions of the k smallest (distance, rank) pairs, in order.
+
+    argpartition finds the k-th smallest distance; everything up to and including it (ties
+    too) is then sorted by distance and rank.
+    """
+    if len(distance) > k:
+        cut = distance[np.argpartition(distance, k - 1)[k - 1]]
+        keep = np.flatnonzero(distance <= cut)
+    else:
+        keep = np.arange(len(distance))
+    return keep[np.lexsort((rank[keep], distance[keep]))[:k]]
+
+
+def after_cursor(distance, rank, after):
+    """Mask of the (distance, rank) pairs sorting after the cursor's pair"""
+    return (distance > after[0]) | ((distance == after[0]) & (rank > after[1]))
+
+
+def accepted(rows, accepts):
+    """Mask of the rows a MemoryIndex._filter() predicate accepts"""
+    return np.fromiter((accepts(i) for i in rows.tolist()), dtype=bool, count=len(rows))
+
+
+def trigram_hits(postings, size, needed):
+    """Rows in any of the query trigrams' postings with at least ``needed`` of them, and their counts"""
+    posted = np.concatenate([u32(rows) for rows in postings]) if postings else np.zeros(0, dtype=np.uint32)
+    if needed <= 0:
+        return np.arange(size), np.bincount(posted, minlength=size)
+    rows, counts = np.unique(posted, return_counts=True)
+    keep = counts >= needed
+    return rows[keep], counts[keep]
+
+
+def fuzzy_rank(candidates, counts, query_ids, size, threshold, sequences, offsets, name_rank, after, limit,
+               accepts=None):
+    """The fuzzy page from candidate rows and the number of query trigrams each contains.
+
+    Candidates are scored in batches from the highest count / size, an upper bound on their
+    similarity, down. Once the k-th best distance is below the lowest distance any remaining
+    candidate could reach, the rest are skipped. Returns (row, similarity, distance) tuples
+    ordered by distance, then name_rank.
+    """
+    candidates = candidates.astype(np.int64)
+    if accepts is not None:
+        keep = accepted(candidates, accepts)
+        candidates, counts = candidates[keep], counts[keep]
+    order = np.argsort(-counts, kind="stable")
+    candidates = candidates[order]
+    bounds = 1.0 - counts[order] / size
+    found_rows = []
+    found_similarity = []
+    found = 0
+    for start in range(0, len(candidates), BATCH_SIZE):
+        if found >= limit:
+            rows = np.concatenate(found_rows)
+            distance = 1.0 - np.concatenate(found_similarity)
+            kth = top_k(distance, name_rank[rows], limit)[-1]
+            if distance[kth] < bounds[start]:
+                break
+        batch = candidates[start:start + BATCH_SIZE]
+        matrix, lengths = pad_sequences(sequences, offsets, batch)
+        similarity = word_similarity_batch(matrix, lengths, query_ids, size)
+        keep = (similarity >= threshold) & after_cursor(1.0 - similarity, name_rank[batch], after)
+        found_rows.append(batch[keep])
+        found_similarity.append(similarity[keep])
+        found += int(keep.sum())
+    if not found:
+        return []
+    rows = np.concatenate(found_rows)
+    similarity = np.concatenate(found_similarity)
+    distance = 1.0 - similarity
+    picked = top_k(distance, name_rank[rows], limit)
+    return list(zip(rows[picked].tolist(), similarity[picked].tolist(), distance[picked].tolist()))
+
+
+def best_weights(rows, weights):
+    """Unique rows, each with the greatest weight it was posted with"""
+    order = np.lexsort((-weights, rows))
+    rows, weights = rows[order], weights[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+    return rows[first], weights[first]
+
+
+def fulltext_rank(clauses, excluded, field_weights, name_rank, after, limit, accepts=None):
+    """The full-text page from the (rows, labels) postings of each clause's lexemes.
+
+    A row's score adds up, clause by clause, the best field weight among the clause's
+    lexemes it contains; rows missing a clause or containing an ``excluded`` rows array
+    drop out. Returns (row, rank) tuples ordered by rank descending, then name_rank.
+    """
+    field_weights = np.asarray(field_weights, dtype=np.float64)
+    rows = scores = None
+    for postings in clauses:
+        clause_rows = np.concatenate([u32(posted) for posted, _ in postings]).astype(np.int64)
+        labels = np.concatenate([np.frombuffer(posted, dtype=np.uint8) for _, posted in postings])
+        clause_rows, weights = best_weights(clause_rows, field_weights[labels])
+        if rows is None:
+            rows, scores = clause_rows, weights
+        else:
+            rows, mine, theirs = np.intersect1d(rows, clause_rows, assume_unique=True, return_indices=True)
+            scores = scores[mine] + weights[theirs]
+        if not len(rows):
+            return []
+    if excluded:
+        keep = ~np.isin(rows, np.concatenate([u32(posted) for posted in excluded]))
+        rows, scores = rows[keep], scores[keep]
+    if accepts is not None:
+        keep = accepted(rows, accepts)
+        rows, scores = rows[keep], scores[keep]
+    # Normalization 32 of ts_rank_cd: rank / (rank + 1)
+    rank = scores / (scores + 1)
+    ranks = name_rank[rows]
+    keep = after_cursor(-rank, ranks, after)
+    rows, rank, ranks = rows[keep], rank[keep], ranks[keep]
+    picked = top_k(-rank, ranks, limit)
+    return list(zip(rows[picked].tolist(), rank[picked].tolist()))
@@ -5,6 +5,8 @@ CREATE TABLE medicines (
     id SERIAL PRIMARY KEY,
     sku_id VARCHAR(255) UNIQUE,
     name VARCHAR(500) NOT NULL,
+    -- Lower-cased name in byte order, so prefix search is a plain B-tree range scan
+    name_lower TEXT COLLATE "C" GENERATED ALWAYS AS (lower(name)) STORED,
     manufacturer_name VARCHAR(500),
     marketer_name VARCHAR(500),
     type VARCHAR(100),
@@ -14,25 +16,70 @@ CREATE TABLE medicines (
     is_discontinued BOOLEAN DEFAULT FALSE,
     available BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Weighted document for full-text search: name (A), composition (B), manufacturer (C)
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(short_composition, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(manufacturer_name, '')), 'C')
+    ) STORED
 );
 
 -- Create indexes for different search types
 
--- Prefix search index (using btree for LIKE queries)
-CREATE INDEX idx_name_prefix ON medicines (name text_pattern_ops);
+-- Prefix search index (range scan on name_lower >= q AND name_lower < successor(q))
+CREATE INDEX idx_name_prefix ON medicines (name_lower, id);
+-- Same range scan for the exclude_discontinued filter, without visiting discontinued rows
+CREATE INDEX idx_name_prefix_active ON medicines (name_lower, id) WHERE NOT is_discontinued;
 CREATE INDEX idx_manufacturer_prefix ON medicines (manufacturer_name text_pattern_ops);
 
--- Full-text search index
-CREATE INDEX idx_name_fts ON medicines USING GIN (to_tsvector('english', name));
-CREATE INDEX idx_composition_fts ON medicines USING GIN (to_tsvector('english', short_composition));
+-- Full-text search index (covers name, composition and manufacturer via search_vector)
+CREATE INDEX idx_search_fts ON medicines USING GIN (search_vector);
 
 -- Trigram indexes for fuzzy search and substring search
 CREATE EXTENSION IF NOT EXISTS pg_trgm;
 CREATE INDEX idx_name_trgm ON medicines USING GIN (name gin_trgm_ops);
+-- GiST supports KNN ordering (<<->) so fuzzy search can stop after the top-k matches
+CREATE INDEX idx_name_trgm_gist ON medicines USING GIST (name gist_trgm_ops);
 CREATE INDEX idx_composition_trgm ON medicines USING GIN (short_composition gin_trgm_ops);
 
 -- Additional indexes for performance
-CREATE INDEX idx_type ON medicines (type);
+-- Type filter, optionally with a price range
+CREATE INDEX idx_type_price ON medicines (type, price);
 CREATE INDEX idx_available ON medicines (available);
 CREATE INDEX idx_discontinued ON medicines (is_discontinued);
+
+
+-- Distinct names for /suggest typeahead. Popularity is the number of active listings carrying the
+-- name; refreshed by import_data.py after every load.
+CREATE MATERIALIZED VIEW name_suggestions AS
+SELECT name_lower, min(name) AS name, count(*) AS popularity
+FROM medicines
+WHERE NOT is_discontinued
+GROUP BY name_lower;
+CREATE UNIQUE INDEX idx_name_suggestions ON name_suggestions (name_lower);
+
+-- Active ingredients parsed from short_composition by import_data.py (see ingredients.py)
+CREATE TABLE ingredients (
+    id SERIAL PRIMARY KEY,
+    -- Normalized lower-case name in byte order, so term lookups are B-tree range scans
+    name TEXT COLLATE "C" NOT NULL UNIQUE
+);
+
+-- Inverted index: ingredient -> medicines containing it, with the strength in that product
+CREATE TABLE medicine_ingredients (
+    medicine_id INTEGER NOT NULL REFERENCES medicines (id) ON DELETE CASCADE,
+    ingredient_id INTEGER NOT NULL REFERENCES ingredients (id),
+    strength TEXT,
+    PRIMARY KEY (medicine_id, ingredient_id)
+);
+CREATE INDEX idx_medicine_ingredients_ingredient ON medicine_ingredients (ingredient_id, medicine_id);
+
+
+-- Bumped by import_data.py after every load so API workers can drop cached results
+CREATE TABLE data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO data_version DEFAULT VALUES;
\ No newline at end of file
@@ -0,0 +1,67 @@
+import argparse
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def env_int(name, default):
+    return int(os.getenv(name) or default)
+
+def env_float(name, default):
+    return float(os.getenv(name) or default)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Medicine Search API with one uvicorn worker process per core")
+    parser.add_argument("--host", default=os.getenv("BIND_HOST", "0.0.0.0"), help="Bind address")
+    parser.add_argument("--port", type=int, default=env_int("PORT", 8000), help="Bind port")
+    parser.add_argument("--workers", type=int, default=env_int("WEB_WORKERS", os.cpu_count() or 1),
+                        help="Worker processes (default: WEB_WORKERS, else one per CPU)")
+    parser.add_argument("--keepalive", type=float, default=env_float("KEEPALIVE_SECONDS", 5),
+                        help="Seconds an idle keep-alive connection stays open")
+    parser.add_argument("--graceful-timeout", type=float, default=env_float("GRACEFUL_SHUTDOWN_SECONDS", 30),
+                        help="Seconds in-flight requests get to finish on SIGTERM before workers are stopped")
+    parser.add_argument("--backlog", type=int, default=env_int("BACKLOG", 2048), help="Listen socket backlog")
+    parser.add_argument("--access-log", action="store_true", default=os.getenv("ACCESS_LOG", "0") == "1",
+                        help="Log every request (costs throughput)")
+    return parser.parse_args(argv)
+
+def prepare_memory_snapshot():
+    """Build or refresh the memory backend's snapshot once, before the workers start and map it"""
+    from memory_backend import MemoryBackend
+
+    backend = MemoryBackend.from_env()
+    if backend.snapshot is None:
+        print("MEMORY_SNAPSHOT is not set, every worker builds its own in-memory index")
+        return
+    backend.load_index()
+    backend.close()
+
+def main(argv=None):
+    args = parse_args(argv)
+    workers = max(args.workers, 1)
+    backend = os.getenv("SEARCH_BACKEND", "postgres")
+    if backend == "memory":
+        prepare_memory_snapshot()
+    else:
+        # Every worker opens its own pool in its lifespan
+        pool_size = env_int("DB_POOL_MAX_SIZE", 10)
+        print(f"Database connections: up to {workers} workers x {pool_size} = {workers * pool_size}")
+
+    print(f"Serving on http://{args.host}:{args.port} with {workers} worker(s), {backend} backend "
+          f"(keep-alive {args.keepalive:g}s, graceful shutdown {args.graceful_timeout:g}s)")
+    print(f"API docs: http://{args.host}:{args.port}/docs")
+    uvicorn.run(
+        "app:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        timeout_keep_alive=args.keepalive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        backlog=args.backlog,
+        access_log=args.access_log,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a shared in-flight execution doesn't finish within the wait timeout"""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key onto one in-flight execution.
+
+    The first caller for a key starts ``compute()`` as its own task; callers arriving while it
+    runs await that task instead of starting another. Everyone gets the same result or the same
+    exception. A caller that times out or is cancelled only stops waiting, the shared execution
+    carries on for the others.
+    """
+
+    def __init__(self, timeout=None, enabled=True):
+        self.timeout = timeout
+        self.enabled = enabled
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls):
+        timeout = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "10"))
+        return cls(timeout=timeout or None, enabled=os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1")
+
+    async def do(self, key, compute):
+        if not self.enabled:
+            return await compute()
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._calls[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise SingleFlightTimeout(f"Search did not complete within {self.timeout}s") from None
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the outcome here so a failure nobody waited for isn't logged as unretrieved
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "timeout_s": self.timeout,
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+        }
@@ -0,0 +1,132 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import current_timer
+
+
+def walk_plan(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk_plan(child)
+
+
+def summarize_plan(plan):
+    """Flag sequential scans and the worst row-count misestimate in an EXPLAIN ANALYZE plan"""
+    seq_scans = []
+    worst_ratio = 1.0
+    worst_node = None
+    for node in walk_plan(plan):
+        if node["Node Type"] == "Seq Scan":
+            seq_scans.append(node.get("Relation Name"))
+        if "Actual Rows" in node:
+            actual = node["Actual Rows"] * node.get("Actual Loops", 1)
+            estimated = node["Plan Rows"] * node.get("Actual Loops", 1)
+            ratio = max(actual, 1) / max(estimated, 1)
+            ratio = max(ratio, 1 / ratio)
+            if ratio > worst_ratio:
+                worst_ratio, worst_node = ratio, node["Node Type"]
+    return {
+        "root": plan["Node Type"],
+        "seq_scans": seq_scans,
+        "worst_estimate_ratio": round(worst_ratio, 2),
+        "worst_estimate_node": worst_node,
+    }
+
+
+class SlowQueryLog:
+    """Bounded ring buffer of slow search queries, a sample of them re-run under EXPLAIN ANALYZE.
+
+    Plans are captured on a single background thread; while one EXPLAIN is running further
+    samples are skipped rather than queued, so a burst of slow queries can't pile up extra load.
+    """
+
+    def __init__(self, threshold_ms=200.0, explain_rate=0.1, capacity=100):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.connection_factory = None  # e.g. DatabasePool.connection, set once the pool exists
+        self._entries = deque(maxlen=capacity)
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+        self._lock = threading.Lock()
+        self._explain_running = False
+        self.slow_total = 0
+        self.explained_total = 0
+        self.explain_skipped = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            threshold_ms=float(os.getenv("SLOW_QUERY_MS", "200")),
+            explain_rate=float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1")),
+            capacity=int(os.getenv("SLOW_QUERY_LOG_SIZE", "100")),
+        )
+
+    def observe(self, sql, params, duration_ms, setup=None):
+        if duration_ms < self.threshold_ms:
+            return
+        timer = current_timer.get()
+        entry = {
+            "timestamp": time.time(),
+            "search_type": timer.search_type if timer else "unknown",
+            "duration_ms": round(duration_ms, 2),
+            "params": dict(params) if isinstance(params, dict) else list(params),
+            "plan": None,
+        }
+        self._entries.append(entry)
+        with self._lock:
+            self.slow_total += 1
+        print(f"Slow {entry['search_type']} query ({entry['duration_ms']} ms): {entry['params']}")
+
+        if self.connection_factory is None or random.random() >= self.explain_rate:
+            return
+        with self._lock:
+            if self._explain_running:
+                self.explain_skipped += 1
+                return
+            self._explain_running = True
+        self._explainer.submit(self._explain, entry, sql, params, setup)
+
+    def _explain(self, entry, sql, params, setup):
+        try:
+            start = time.perf_counter()
+            with self.connection_factory() as conn:
+                with conn.cursor() as cursor:
+                    if setup:
+                        cursor.execute(setup, params)
+                    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+                    document = cursor.fetchone()[0]
+            if isinstance(document, str):
+                document = json.loads(document)
+            entry["plan"] = document[0]
+            entry["plan_summary"] = summarize_plan(document[0]["Plan"])
+            entry["explain_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            with self._lock:
+                self.explained_total += 1
+        except Exception as e:
+            entry["explain_error"] = str(e)
+        finally:
+            with self._lock:
+                self._explain_running = False
+
+    def entries(self, limit=None):
+        """Newest first"""
+        items = list(self._entries)[::-1]
+        return items[:limit] if limit else items
+
+    def close(self):
+        self._explainer.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "threshold_ms": self.threshold_ms,
+            "explain_rate": self.explain_rate,
+            "capacity": self._entries.maxlen,
+            "buffered": len(self._entries),
+            "slow_total": self.slow_total,
+            "explained_total": self.explained_total,
+            "explain_skipped": self.explain_skipped,
+        }
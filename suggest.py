@@ -0,0 +1,81 @@
+import os
+
+from cache import LRUCache
+
+
+class Suggester:
+    """Typeahead candidates per prefix, narrowed in memory while the user keeps typing.
+
+    The candidate set for a prefix is every suggestion name starting with it, most popular
+    first. When a later keystroke extends a prefix whose complete set is still cached, the
+    new set is filtered from it instead of queried again; popularity order survives filtering.
+    Sets that hit the candidate cap are incomplete and can only answer their own prefix.
+    """
+
+    SQL = """
+        SELECT name_lower, name
+        FROM name_suggestions
+        WHERE name_lower >= %(low)s AND name_lower < %(high)s
+        ORDER BY popularity DESC, name_lower
+        LIMIT %(limit)s
+    """
+
+    def __init__(self, max_candidates=2000, cache_entries=5000, ttl=60.0):
+        self.max_candidates = max_candidates
+        self.cache = LRUCache(max_entries=cache_entries, ttl=ttl)
+        self.exact_hits = 0
+        self.narrowed = 0
+        self.queried = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_candidates=int(os.getenv("SUGGEST_MAX_CANDIDATES", "2000")),
+            cache_entries=int(os.getenv("SUGGEST_CACHE_ENTRIES", "5000")),
+            ttl=float(os.getenv("SUGGEST_TTL_SECONDS", "60")),
+        )
+
+    @staticmethod
+    def _key(version, prefix):
+        return f"v{version}|{prefix}"
+
+    def cached(self, version, prefix):
+        """Candidates for prefix from the cache, directly or by narrowing a shorter prefix's set"""
+        candidates = self.cache.get(self._key(version, prefix))
+        if candidates is not None:
+            self.exact_hits += 1
+            return candidates
+        for end in range(len(prefix) - 1, 0, -1):
+            broader = self.cache.get(self._key(version, prefix[:end]))
+            if broader is None:
+                continue
+            complete, entries = broader
+            if not complete:
+                return None
+            candidates = (True, [entry for entry in entries if entry[0].startswith(prefix)])
+            self.cache.set(self._key(version, prefix), candidates)
+            self.narrowed += 1
+            return candidates
+        return None
+
+    def load(self, cursor, version, prefix, low, high):
+        """Query the candidate set for prefix and cache it"""
+        cursor.execute(self.SQL, {"low": low, "high": high, "limit": self.max_candidates + 1})
+        entries = cursor.fetchall()
+        complete = len(entries) <= self.max_candidates
+        candidates = (complete, entries[:self.max_candidates])
+        self.cache.set(self._key(version, prefix), candidates)
+        self.queried += 1
+        return candidates
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return {
+            "max_candidates": self.max_candidates,
+            "exact_hits": self.exact_hits,
+            "narrowed": self.narrowed,
+            "queried": self.queried,
+            **self.cache.stats(),
+        }